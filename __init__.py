@@ -6,20 +6,24 @@ from flask_cors import CORS
 db = SQLAlchemy()
 jwt = JWTManager()
 
-def create_app():
+def create_app(start_monitor=False, config=None):
     app = Flask(__name__)
     CORS(app, resources={r"/*": {"origins": "*"}})
     app.config.from_object('config.Config')
+    if config:
+        app.config.update(config)
 
     db.init_app(app)
     jwt.init_app(app)
 
     with app.app_context():
         from . import views
-        db.create_all()
+        from .migrations import migrate
+        migrate()
         app.register_blueprint(views.views)
-        from .monitor import start_async_monitor
-        start_async_monitor()
+        if start_monitor:
+            from .monitor import start_async_monitor
+            start_async_monitor()
         print(app.url_map)
 
     return app
@@ -0,0 +1,46 @@
+import statistics
+from flask import current_app
+from .models import db, MonitoredArea, Change
+
+
+def interval_bounds(ma):
+    minimum = ma.min_interval or ma.time_interval
+    maximum = ma.max_interval or ma.time_interval * current_app.config.get('ADAPTIVE_MAX_FACTOR', 8)
+    return minimum, max(minimum, maximum)
+
+
+def change_gaps(area_id, now, history):
+    # Minuti tra le ultime modifiche, compreso il tempo trascorso dall'ultima:
+    # un'area che resta ferma a lungo alza da sola la mediana
+    times = [now] + [row.change_detected_at for row in db.session.query(Change.change_detected_at).filter(
+        Change.monitored_area_id == area_id).order_by(Change.change_detected_at.desc()).limit(history)]
+    return [(newer - older).total_seconds() / 60 for newer, older in zip(times, times[1:])]
+
+
+# Intervallo adattivo: senza modifiche l'intervallo cresce di ADAPTIVE_GROWTH a
+# ogni controllo, ma non oltre metà dell'intervallo mediano tra le ultime
+# modifiche; una modifica lo riporta subito al minimo. Il risultato resta sempre
+# tra min_interval e max_interval e viene salvato in effective_interval.
+def update_interval(ma, change_detected, now):
+    if not ma.adaptive_interval:
+        ma.effective_interval = None
+        return ma.time_interval
+
+    config = current_app.config
+    minimum, maximum = interval_bounds(ma)
+    if change_detected:
+        interval = minimum
+    else:
+        interval = (ma.effective_interval or ma.time_interval) * config.get('ADAPTIVE_GROWTH', 1.5)
+        gaps = change_gaps(ma.id, now, config.get('ADAPTIVE_HISTORY', 5))
+        if len(gaps) >= 2:
+            interval = min(interval, statistics.median(gaps) / 2)
+    ma.effective_interval = int(round(min(max(interval, minimum), maximum)))
+    return ma.effective_interval
+
+
+def renders_saved_per_hour():
+    rows = db.session.query(MonitoredArea.time_interval, MonitoredArea.effective_interval).filter(
+        MonitoredArea.adaptive_interval.is_(True), MonitoredArea.effective_interval.isnot(None)).all()
+    return sum(60 / time_interval - 60 / effective_interval for time_interval, effective_interval in rows
+               if time_interval and effective_interval)
@@ -1,15 +1,8 @@
 from . import create_app
-import threading
-from . import monitor
-
-def main():
-    print("Starting monitoring thread")
-    task_thread = threading.Thread(target=monitor.monitor_websites)
-    task_thread.daemon = True
-    task_thread.start()
 
+# Solo API: il monitor gira nei processi worker (python -m <pacchetto>.worker),
+# altrimenti ogni processo del server web controllerebbe tutte le aree
 app = create_app()
 
 if __name__ == '__main__':
-    main()
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
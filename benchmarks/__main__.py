@@ -0,0 +1,40 @@
+import argparse
+from . import bench_compare, bench_monitor, bench_api
+from .common import make_app, write_results
+
+# Uso: python -m <pacchetto>.benchmarks [compare monitor api] --output risultati.json
+# e poi python -m <pacchetto>.benchmarks.diff prima.json dopo.json per confrontare due commit
+SUITES = {
+    'compare': bench_compare,
+    'monitor': bench_monitor,
+    'api': bench_api,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the webmonitor benchmarks and write the results as JSON.')
+    parser.add_argument('suites', nargs='*', help=f"suites to run: {', '.join(SUITES)} (default: all)")
+    parser.add_argument('--output', default='benchmark-results.json')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='smaller corpus, for a fast sanity run')
+    parser.add_argument('--database', help='database URL (default: a temporary SQLite file)')
+    args = parser.parse_args()
+    unknown = [name for name in args.suites if name not in SUITES]
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(unknown)}")
+
+    results = []
+    for name in args.suites or list(SUITES):
+        # Un database nuovo per ogni suite, così i dati di una non pesano sull'altra
+        app = make_app(args.database)
+        suite_results = SUITES[name].run(app, repeat=args.repeat, quick=args.quick)
+        for entry in suite_results:
+            print(f"{entry['suite']:8} {entry['case']:28} {entry['stats']['median'] * 1000:10.2f} ms  "
+                  f"{entry['params']}")
+        results.extend(suite_results)
+    write_results(args.output, results)
+    print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import json
+from datetime import datetime, timedelta
+from .common import measure, result
+
+AREAS = 2000
+CHANGES_PER_AREA = 10
+QUICK_AREAS = 200
+BATCH_SIZE = 5000
+
+
+# Popola il database con un utente, AREAS aree su AREAS / 10 siti e
+# CHANGES_PER_AREA modifiche per area, con inserimenti in blocco
+def seed(areas, changes_per_area):
+    from ..models import db, User, Website, MonitoredArea, Change
+
+    user = User(username='api-benchmark', password='-', email='api-benchmark@example.com')
+    db.session.add(user)
+    db.session.commit()
+
+    websites = max(1, areas // 10)
+    db.session.execute(Website.__table__.insert(),
+                       [{'url': f'https://site{index}.benchmark.invalid/'} for index in range(websites)])
+    website_ids = [row.id for row in db.session.query(Website.id).order_by(Website.id)]
+    db.session.execute(MonitoredArea.__table__.insert(), [
+        {'user_id': user.id, 'website_id': website_ids[index % websites], 'name': f'Area {index}',
+         'area_selector': f'#area-{index}', 'time_interval': 60, 'compare_mode': 'visual'}
+        for index in range(areas)])
+    area_ids = [row.id for row in db.session.query(MonitoredArea.id).filter_by(user_id=user.id)]
+
+    start = datetime(2024, 1, 1)
+    regions = json.dumps([[10, 20, 64, 64]])
+    rows = []
+    for area_index, area_id in enumerate(area_ids):
+        for change_index in range(changes_per_area):
+            rows.append({'monitored_area_id': area_id, 'change_snapshot': '',
+                         'change_summary': 'Change detected',
+                         'change_detected_at': start + timedelta(minutes=change_index * 60 + area_index),
+                         'screenshot_key': f'{area_id:032x}{change_index:032x}',
+                         'changed_regions': regions, 'reviewed': change_index % 3 == 0})
+            if len(rows) >= BATCH_SIZE:
+                db.session.execute(Change.__table__.insert(), rows)
+                rows = []
+    if rows:
+        db.session.execute(Change.__table__.insert(), rows)
+    db.session.commit()
+    return user, area_ids
+
+
+def run(app, repeat=5, quick=False):
+    from flask_jwt_extended import create_access_token
+    from ..views import JWTIdentity
+
+    areas = QUICK_AREAS if quick else AREAS
+    with app.app_context():
+        user, area_ids = seed(areas, CHANGES_PER_AREA)
+        token = create_access_token(identity=JWTIdentity(user))
+    headers = {'Authorization': f'Bearer {token}'}
+    client = app.test_client()
+    params = {'areas': areas, 'changes': areas * CHANGES_PER_AREA}
+
+    def get(path):
+        response = client.get(path, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} returned {response.status_code}')
+        return response.get_json()
+
+    def walk_changes():
+        # Tutte le modifiche, pagina dopo pagina, seguendo il cursore
+        cursor, pages = None, 0
+        while True:
+            page = get('/changes?limit=200' + (f'&cursor={cursor}' if cursor else ''))
+            pages += 1
+            cursor = page['next_cursor']
+            if cursor is None:
+                return pages
+
+    results = [
+        result('api', 'get_websites', params, measure(lambda: get('/websites'), repeat)),
+        result('api', 'get_changes_first_page', params, measure(lambda: get('/changes'), repeat)),
+        result('api', 'get_changes_area', params,
+               measure(lambda: get(f'/changes?area_id={area_ids[len(area_ids) // 2]}'), repeat)),
+        result('api', 'get_changes_unreviewed', params, measure(lambda: get('/changes?reviewed=false'), repeat)),
+        result('api', 'get_changes_walk', params, measure(walk_changes, max(1, repeat // 2)),
+               pages=walk_changes()),
+    ]
+    return results
@@ -0,0 +1,94 @@
+import itertools
+import cv2
+import numpy as np
+from types import SimpleNamespace
+from .common import measure, result
+
+RESOLUTIONS = ((320, 240), (1280, 800), (1920, 1080), (1280, 4000))
+CHANGE_RATES = (0.0, 0.001, 0.01, 0.1)
+QUICK_RESOLUTIONS = ((320, 240), (1280, 800))
+
+
+# Pagina sintetica: blocchi di colore e righe di testo, sempre uguale a parità di seed
+def synthetic_page(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(max(4, width * height // 40000)):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        w, h = int(rng.integers(20, max(21, width // 3))), int(rng.integers(10, max(11, height // 6)))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        cv2.rectangle(image, (x, y), (x + w, y + h), color, -1)
+    for line_y in range(20, height, 24):
+        cv2.putText(image, f'Lorem ipsum {line_y} dolor sit amet', (10, line_y), cv2.FONT_HERSHEY_SIMPLEX,
+                    0.5, (30, 30, 30), 1)
+    return image
+
+
+# Modifica un rettangolo che copre circa change_rate dell'immagine
+def changed_copy(image, change_rate, seed=1):
+    changed = image.copy()
+    if change_rate <= 0:
+        return changed
+    height, width = image.shape[:2]
+    rng = np.random.default_rng(seed)
+    side = max(1, int((width * height * change_rate) ** 0.5))
+    w, h = min(width, side), min(height, max(1, int(width * height * change_rate) // min(width, side)))
+    x, y = int(rng.integers(0, width - w + 1)), int(rng.integers(0, height - h + 1))
+    changed[y:y + h, x:x + w] = 255 - changed[y:y + h, x:x + w]
+    return changed
+
+
+def encode(image):
+    return cv2.imencode('.png', image)[1].tobytes()
+
+
+def run(app, repeat=5, quick=False):
+    from .. import monitor
+
+    results = []
+    resolutions = QUICK_RESOLUTIONS if quick else RESOLUTIONS
+    ids = itertools.count(1)
+    with app.app_context():
+        for width, height in resolutions:
+            before = synthetic_page(width, height)
+            before_png = encode(before)
+            for change_rate in CHANGE_RATES:
+                after = changed_copy(before, change_rate)
+                after_png = encode(after)
+                params = {'width': width, 'height': height, 'change_rate': change_rate}
+
+                outcome = {}
+
+                def compare():
+                    outcome['changed'], _ = monitor.compare_images(before, after)
+
+                results.append(result('compare', 'compare_images', params, measure(compare, repeat),
+                                      changed=outcome['changed']))
+
+                # detect_changes senza browser: la cattura restituisce il PNG già pronto,
+                # si misura la catena hash esatto -> dHash -> SSIM a tile
+                last_change = SimpleNamespace(id=0, monitored_area_id=next(ids), screenshot=before_png,
+                                              screenshot_key=None, delta_key=None, content_hash=None,
+                                              perceptual_hash=None)
+                take_screenshot = monitor.take_screenshot
+                monitor.take_screenshot = lambda url, selector=None, page_load_timeout=None: after_png
+                try:
+                    def detect():
+                        # Hash e frame del riferimento non in cache, come al primo controllo
+                        # dopo una nuova modifica: ogni giro usa un id di riferimento diverso
+                        last_change.id = next(ids)
+                        last_change.content_hash = last_change.perceptual_hash = None
+                        outcome['detected'] = monitor.detect_changes('http://benchmark.invalid/', last_change)[0]
+
+                    results.append(result('compare', 'detect_changes', params, measure(detect, repeat),
+                                          changed=outcome['detected']))
+
+                    def detect_warm():
+                        # Riferimento già nella ReferenceCache: si decodifica solo la nuova cattura
+                        outcome['detected'] = monitor.detect_changes('http://benchmark.invalid/', last_change)[0]
+
+                    results.append(result('compare', 'detect_changes_warm', params, measure(detect_warm, repeat),
+                                          changed=outcome['detected']))
+                finally:
+                    monitor.take_screenshot = take_screenshot
+    return results
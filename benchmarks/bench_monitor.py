@@ -0,0 +1,146 @@
+import hashlib
+import threading
+import time
+from urllib.parse import urlparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .common import measure, result
+
+# Peso delle pagine servite: numero di blocchi di contenuto
+PAGE_WEIGHTS = {'light': 20, 'medium': 500, 'heavy': 5000}
+AREAS = (('body', 'visual'), ('#content', 'visual'), ('#content', 'text'))
+
+
+def build_page(blocks):
+    rows = ''.join(f'<div class="item"><h2>Item {index}</h2><p>{"lorem ipsum " * 8}</p>'
+                   f'<table><tr><td>{index}</td><td>{index * 7}</td></tr></table></div>'
+                   for index in range(blocks))
+    return (f'<!doctype html><html><head><title>Benchmark {blocks}</title></head>'
+            f'<body><header>Benchmark</header><main id="content">{rows}</main></body></html>').encode('utf-8')
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    pages = {}
+
+    def do_GET(self):
+        body = self.pages.get(urlparse(self.path).path.strip('/'))
+        if body is None:
+            self.send_error(404)
+            return
+        etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    PageHandler.pages = {name: build_page(blocks) for name, blocks in PAGE_WEIGHTS.items()}
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def outcome_counts():
+    from ..metrics import Metrics
+    return {dict(labels)['result']: value for _, labels, value in Metrics.getInstance().area_checks.samples()}
+
+
+def stage_totals():
+    from ..metrics import Metrics
+    totals = {}
+    for name, labels, value in Metrics.getInstance().stage_seconds.samples():
+        if name.endswith('_sum'):
+            totals[dict(labels)['stage']] = value
+    return totals
+
+
+def delta(after, before):
+    return {key: round(value - before.get(key, 0), 6) for key, value in after.items() if value != before.get(key, 0)}
+
+
+def seed_websites(base_url, precheck_enabled, tag):
+    from ..models import db, User, Website, MonitoredArea
+    user = User.query.filter_by(username='benchmark').first()
+    if user is None:
+        user = User(username='benchmark', password='-', email='benchmark@example.com')
+        db.session.add(user)
+        db.session.flush()
+    websites = {}
+    for weight in PAGE_WEIGHTS:
+        # La query rende unico l'URL di ogni gruppo di siti
+        url = f'{base_url}/{weight}?set={tag}'
+        website = Website(url=url, precheck_enabled=precheck_enabled)
+        db.session.add(website)
+        db.session.flush()
+        area_ids = []
+        for selector, compare_mode in AREAS:
+            area = MonitoredArea(user_id=user.id, website_id=website.id, name=f'{weight} {selector}',
+                                 area_selector=selector, compare_mode=compare_mode, time_interval=1)
+            db.session.add(area)
+            db.session.flush()
+            area_ids.append(area.id)
+        websites[weight] = (website.id, area_ids)
+    db.session.commit()
+    return websites
+
+
+def run(app, repeat=5, quick=False):
+    from ..monitor import check_website
+    from ..executor import CheckExecutor
+    from ..browser_pool import BrowserPool
+
+    server = start_server()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+    results = []
+    try:
+        with app.app_context():
+            for precheck_enabled in (False, True):
+                case = 'check_website_precheck' if precheck_enabled else 'check_website_render'
+                websites = seed_websites(base_url, precheck_enabled, case)
+                for weight, (website_id, area_ids) in websites.items():
+                    if quick and weight == 'heavy':
+                        continue
+                    outcomes, stages = outcome_counts(), stage_totals()
+                    stats = measure(lambda: check_website(app, website_id, area_ids, 'benchmark'), repeat)
+                    results.append(result('monitor', case,
+                                          {'weight': weight, 'blocks': PAGE_WEIGHTS[weight], 'areas': len(area_ids)},
+                                          stats, outcomes=delta(outcome_counts(), outcomes),
+                                          stage_seconds=delta(stage_totals(), stages)))
+
+            # Giro completo: tutti i siti passano dal pool di worker, come nel ciclo del monitor
+            websites = seed_websites(base_url, False, 'tick')
+            executor = CheckExecutor(max_workers=app.config.get('MONITOR_MAX_WORKERS', 2),
+                                     per_host_limit=len(websites),
+                                     check_timeout=app.config.get('MONITOR_CHECK_TIMEOUT', 60))
+
+            def tick():
+                for website_id, area_ids in websites.values():
+                    while not executor.submit(website_id, '127.0.0.1', check_website, app, website_id, area_ids,
+                                              'benchmark'):
+                        time.sleep(0.01)
+                while executor.in_flight():
+                    time.sleep(0.01)
+
+            outcomes = outcome_counts()
+            stats = measure(tick, repeat)
+            executor.shutdown()
+            results.append(result('monitor', 'tick', {'websites': len(websites),
+                                                      'workers': executor.max_workers}, stats,
+                                  outcomes=delta(outcome_counts(), outcomes)))
+    finally:
+        server.shutdown()
+        if BrowserPool._instance is not None:
+            BrowserPool._instance.shutdown()
+    return results
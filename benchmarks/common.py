@@ -0,0 +1,71 @@
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+def measure(fn, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return {
+        'runs': repeat,
+        'min': timings[0],
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'p95': timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))],
+        'max': timings[-1],
+    }
+
+
+def result(suite, case, params, stats, **extra):
+    return {'suite': suite, 'case': case, 'params': params, 'stats': stats, 'extra': extra}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, results):
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'argv': sys.argv[1:],
+        },
+        'results': results,
+    }
+    with open(path, 'w') as results_file:
+        json.dump(report, results_file, indent=2)
+    return report
+
+
+def make_app(database_url=None):
+    # Database SQLite temporaneo se non ne viene indicato uno, così i benchmark
+    # non toccano mai il database di produzione
+    from .. import create_app
+    blob_root = tempfile.mkdtemp(prefix='bench-blobs-')
+    reference_root = tempfile.mkdtemp(prefix='bench-references-')
+    if database_url is None:
+        database_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'bench.db')
+    return create_app(start_monitor=False, config={
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'BLOB_STORE_ROOT': blob_root,
+        'REFERENCE_CACHE_DIR': reference_root,
+    })
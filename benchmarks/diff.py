@@ -0,0 +1,40 @@
+import argparse
+import json
+
+
+def load(path):
+    with open(path) as results_file:
+        report = json.load(results_file)
+    return report['meta'], {(entry['suite'], entry['case'], json.dumps(entry['params'], sort_keys=True)): entry
+                            for entry in report['results']}
+
+
+# Confronta due file di risultati (es. prima e dopo una modifica) caso per caso,
+# sulla mediana; i casi presenti in un solo file vengono segnalati a parte
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=5.0,
+                        help='percent change below which a case is reported as unchanged')
+    args = parser.parse_args()
+
+    baseline_meta, baseline = load(args.baseline)
+    candidate_meta, candidate = load(args.candidate)
+    print(f"baseline  {baseline_meta.get('commit')}  {baseline_meta.get('timestamp')}")
+    print(f"candidate {candidate_meta.get('commit')}  {candidate_meta.get('timestamp')}")
+
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before = baseline[key]['stats']['median']
+        after = candidate[key]['stats']['median']
+        change = (after - before) / before * 100 if before else 0.0
+        verdict = 'faster' if change <= -args.threshold else 'slower' if change >= args.threshold else ''
+        suite, case, params = key
+        print(f"{suite:8} {case:28} {before * 1000:10.2f} -> {after * 1000:10.2f} ms {change:+7.1f}% {verdict:6} "
+              f"{params}")
+    for key in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"only in {'baseline' if key in baseline else 'candidate'}: {' '.join(key)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from flask import current_app
+
+
+# Archivio di immagini indirizzato per contenuto: la chiave è lo SHA-256 dei
+# byte, quindi catture identiche vengono salvate una sola volta.
+class BlobStore(ABC):
+    _instance = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def getInstance():
+        with BlobStore._lock:
+            if BlobStore._instance is None:
+                config = current_app.config
+                backend = config.get('BLOB_STORE_BACKEND', 'local')
+                if backend == 'local':
+                    BlobStore._instance = LocalBlobStore(config.get('BLOB_STORE_ROOT', 'blobs'))
+                else:
+                    raise ValueError(f"Unknown blob store backend: {backend}")
+            return BlobStore._instance
+
+    @staticmethod
+    def key_for(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, data):
+        key = self.key_for(data)
+        self.put_as(key, data)
+        return key
+
+    @abstractmethod
+    def put_as(self, key, data):
+        pass
+
+    @abstractmethod
+    def get(self, key):
+        pass
+
+    @abstractmethod
+    def exists(self, key):
+        pass
+
+    @abstractmethod
+    def delete(self, key):
+        pass
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def put_as(self, key, data):
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Scrittura atomica: un lettore non vede mai un file a metà
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def get(self, key):
+        with open(self.path(key), 'rb') as blob_file:
+            return blob_file.read()
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+def load_screenshot(change):
+    if change.delta_key:
+        # Frame compattato: si ricostruisce dal keyframe, che è sempre completo
+        from .models import db, Change
+        from .deltas import decode_png, encode_png, apply_delta
+        store = BlobStore.getInstance()
+        keyframe = db.session.get(Change, change.delta_base_id)
+        return encode_png(apply_delta(decode_png(load_screenshot(keyframe)), store.get(change.delta_key)))
+    # Le righe non ancora migrate hanno ancora il PNG nella colonna screenshot
+    if change.screenshot_key:
+        return BlobStore.getInstance().get(change.screenshot_key)
+    return change.screenshot
+
+
+def load_diff_image(difference):
+    if difference.diff_image_key:
+        return BlobStore.getInstance().get(difference.diff_image_key)
+    return difference.diff_image
@@ -0,0 +1,206 @@
+import threading
+import time
+from contextlib import contextmanager
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from flask import current_app
+from .logger import Logger
+from .metrics import Metrics
+
+
+def chrome_options():
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--disable-gpu')
+    options.add_argument('--window-size=1920,1080')
+    return options
+
+
+# Origini della pagina e di tutti i suoi iframe, dall'albero dei frame CDP
+def frame_origins(frame_tree):
+    origin = frame_tree['frame'].get('securityOrigin', '')
+    origins = {origin} if origin.startswith(('http://', 'https://')) else set()
+    for child in frame_tree.get('childFrames', []):
+        origins.update(frame_origins(child))
+    return origins
+
+
+# Nessun browser libero entro il timeout: il pool è occupato, il sito non c'entra
+class PoolExhausted(TimeoutError):
+    pass
+
+
+class PooledBrowser:
+    def __init__(self):
+        self.driver = webdriver.Chrome(options=chrome_options())
+        self.home_handle = self.driver.current_window_handle
+        self.pages = 0
+        self.broken = False
+        self.last_used = time.monotonic()
+
+    def is_alive(self):
+        try:
+            return self.home_handle in self.driver.window_handles
+        except WebDriverException:
+            return False
+
+    def open_tab(self):
+        self.driver.switch_to.new_window('tab')
+        self.pages += 1
+
+    def close_tab(self):
+        # Chiude il tab usato e torna al tab "home", che resta sempre vuoto
+        origins = set()
+        for handle in self.driver.window_handles:
+            if handle != self.home_handle:
+                self.driver.switch_to.window(handle)
+                origins.update(frame_origins(self.driver.execute_cdp_cmd('Page.getFrameTree', {})['frameTree']))
+                self.driver.close()
+        self.driver.switch_to.window(self.home_handle)
+        self.clear_state(origins)
+
+    def clear_state(self, origins):
+        # delete_all_cookies agisce solo sul documento attivo (qui about:blank): cookie e
+        # storage si cancellano via CDP, così un browser riusato renderizza come uno nuovo
+        self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        for origin in origins:
+            self.driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+
+    def quit(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            Logger.getInstance().log(f"Error closing browser: {e}", level='error')
+
+
+class BrowserPool:
+    _instance = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def getInstance():
+        with BrowserPool._lock:
+            if BrowserPool._instance is None:
+                config = current_app.config
+                BrowserPool(size=config.get('BROWSER_POOL_SIZE', 2),
+                            max_pages=config.get('BROWSER_MAX_PAGES', 100),
+                            health_check_interval=config.get('BROWSER_HEALTH_CHECK_INTERVAL', 60),
+                            page_load_timeout=config.get('BROWSER_PAGE_LOAD_TIMEOUT', 30),
+                            max_page_seconds=config.get('MONITOR_CHECK_TIMEOUT', 60))
+            return BrowserPool._instance
+
+    def __init__(self, size=2, max_pages=100, health_check_interval=60, page_load_timeout=30, max_page_seconds=60):
+        if BrowserPool._instance is not None:
+            raise Exception("This class is a singleton!")
+        BrowserPool._instance = self
+        self.size = size
+        self.max_pages = max_pages
+        self.health_check_interval = health_check_interval
+        self.page_load_timeout = page_load_timeout
+        self.max_page_seconds = max_page_seconds
+        self._idle = []
+        self._in_use = {}
+        self._created = 0
+        self._available = threading.Condition()
+
+        health_thread = threading.Thread(target=self._health_check_loop)
+        health_thread.daemon = True
+        health_thread.start()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._available:
+            while not self._idle and self._created >= self.size:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolExhausted("No browser available in the pool")
+                self._available.wait(remaining)
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+
+        try:
+            return PooledBrowser()
+        except Exception:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def release(self, browser):
+        browser.last_used = time.monotonic()
+        if browser.broken or browser.pages >= self.max_pages:
+            reason = "crashed" if browser.broken else f"served {browser.pages} pages"
+            Logger.getInstance().log(f"Recycling browser: {reason}", level='warning' if browser.broken else 'info')
+            self._discard(browser)
+            return
+        with self._available:
+            self._idle.append(browser)
+            self._available.notify()
+
+    def _discard(self, browser):
+        browser.quit()
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+
+    @contextmanager
+    def page(self, page_load_timeout=None, timeout=None):
+        with Metrics.getInstance().stage('browser_acquire'):
+            browser = self.acquire(timeout=timeout)
+        with self._available:
+            self._in_use[id(browser)] = (browser, time.monotonic())
+        try:
+            browser.open_tab()
+            browser.driver.set_page_load_timeout(page_load_timeout or self.page_load_timeout)
+            yield browser.driver
+        except WebDriverException:
+            if not browser.is_alive():
+                browser.broken = True
+            raise
+        finally:
+            with self._available:
+                self._in_use.pop(id(browser), None)
+            if not browser.broken:
+                try:
+                    browser.close_tab()
+                except WebDriverException:
+                    browser.broken = True
+            self.release(browser)
+
+    def _health_check_loop(self):
+        while True:
+            time.sleep(self.health_check_interval)
+            with self._available:
+                idle = list(self._idle)
+                self._idle.clear()
+            for browser in idle:
+                if browser.is_alive():
+                    with self._available:
+                        self._idle.append(browser)
+                        self._available.notify()
+                else:
+                    Logger.getInstance().log("Idle browser failed health check, recycling", level='warning')
+                    self._discard(browser)
+            self._reap_stuck()
+
+    # Browser in uso oltre max_page_seconds (controllo bloccato in una chiamata al driver):
+    # chiuderlo fa fallire la chiamata, il controllo termina e page() lo scarta
+    def _reap_stuck(self):
+        now = time.monotonic()
+        with self._available:
+            stuck = [(browser, now - since) for browser, since in self._in_use.values()
+                     if now - since > self.max_page_seconds]
+        for browser, elapsed in stuck:
+            Logger.getInstance().log(f"Browser busy for {elapsed:.0f}s, closing it", level='warning')
+            browser.broken = True
+            browser.quit()
+
+    def shutdown(self):
+        with self._available:
+            idle = list(self._idle)
+            self._idle.clear()
+        for browser in idle:
+            self._discard(browser)
@@ -0,0 +1,224 @@
+import time
+import traceback
+from datetime import datetime
+from threading import Thread, Lock
+from flask import current_app
+from sqlalchemy import or_
+from sqlalchemy.orm import defer
+from .models import db, User, MonitoredArea, Change
+from .blobstore import BlobStore, load_screenshot
+from .deltas import decode_png, encode_delta
+from .thumbnails import thumbnail_key, thumbnail_widths
+from .leases import acquire_lease, release_leases
+from .logger import Logger
+
+RETENTION_DEFAULTS = {
+    'retention_full_frames': 10,
+    'retention_keyframe_interval': 10,
+    'retention_downsample_hours': 24,
+}
+
+
+# Politica di un'area: valori dell'area, poi quelli dell'utente, poi Config
+def retention_policy(ma, user):
+    policy = {}
+    for name, default in RETENTION_DEFAULTS.items():
+        value = getattr(ma, name)
+        if value is None and user is not None:
+            value = getattr(user, name)
+        if value is None:
+            value = current_app.config.get(name.upper(), default)
+        policy[name] = value
+    return policy
+
+
+# Divide la storia (dalla più recente) in: ultimi N frame completi, frame più
+# vecchi da conservare (al più uno per intervallo di downsample_hours, il più
+# recente) e frame da eliminare. I conservati sono restituiti dal più vecchio.
+def plan_retention(changes, full_frames, downsample_hours):
+    recent, older = changes[:full_frames], changes[full_frames:]
+    kept, pruned, buckets = [], [], set()
+    for change in older:
+        if downsample_hours:
+            bucket = int(change.change_detected_at.timestamp() // (downsample_hours * 3600))
+            if bucket in buckets:
+                pruned.append(change)
+                continue
+            buckets.add(bucket)
+        kept.append(change)
+    kept.reverse()
+    return recent, kept, pruned
+
+
+# Blob non più referenziati dopo una compattazione. Vengono cancellati solo a un
+# giro successivo, e solo se nessuna riga li usa ancora: una cattura identica
+# salvata nel frattempo dal monitor riusa la stessa chiave.
+class BlobReaper:
+    def __init__(self, grace_seconds=600):
+        self.grace_seconds = grace_seconds
+        self._pending = {}
+        self._lock = Lock()
+
+    def release(self, key, kind):
+        if key:
+            with self._lock:
+                self._pending.setdefault((key, kind), time.monotonic())
+
+    def collect(self, force=False):
+        now = time.monotonic()
+        with self._lock:
+            ready = [entry for entry, released_at in self._pending.items()
+                     if force or now - released_at >= self.grace_seconds]
+        store = BlobStore.getInstance()
+        deleted = 0
+        for key, kind in ready:
+            if kind == 'delta':
+                if not Change.query.filter_by(delta_key=key).count():
+                    store.delete(key)
+                    deleted += 1
+            else:
+                if not Change.query.filter(Change.screenshot_key == key, Change.delta_key.is_(None)).count():
+                    store.delete(key)
+                    deleted += 1
+                if not Change.query.filter_by(screenshot_key=key).count():
+                    for width in thumbnail_widths():
+                        store.delete(thumbnail_key(key, width))
+            with self._lock:
+                self._pending.pop((key, kind), None)
+        return deleted
+
+
+def compact_area(ma, policy, reaper):
+    store = BlobStore.getInstance()
+    changes = Change.query.options(defer(Change.screenshot)).filter(
+        Change.monitored_area_id == ma.id,
+        or_(Change.screenshot_key.isnot(None), Change.screenshot.isnot(None))).order_by(
+        Change.change_detected_at.desc(), Change.id.desc()).all()
+    stats = {'kept_full': 0, 'keyframes': 0, 'deltas': 0, 'pruned': 0}
+    if len(changes) <= policy['retention_full_frames'] and not any(change.delta_key for change in changes):
+        return stats
+
+    for change in changes:
+        if change.screenshot_key is None:
+            # Riga precedente al BlobStore: prima si sposta l'immagine
+            change.screenshot_key = store.put(change.screenshot)
+            change.screenshot = None
+
+    recent, kept, pruned = plan_retention(changes, max(1, policy['retention_full_frames']),
+                                          policy['retention_downsample_hours'])
+    keyframe_interval = max(1, policy['retention_keyframe_interval'])
+
+    keyframe, keyframe_image, since_keyframe = None, None, 0
+    for change in kept:
+        if keyframe is not None and since_keyframe < keyframe_interval - 1:
+            if change.delta_key and change.delta_base_id == keyframe.id:
+                since_keyframe += 1
+                stats['deltas'] += 1
+                continue
+            if keyframe_image is None:
+                keyframe_image = decode_png(load_screenshot(keyframe))
+            delta = encode_delta(decode_png(load_screenshot(change)), keyframe_image)
+            if delta is not None:
+                reaper.release(change.delta_key or change.screenshot_key,
+                               'delta' if change.delta_key else 'full')
+                change.delta_key = store.put(delta)
+                change.delta_base_id = keyframe.id
+                since_keyframe += 1
+                stats['deltas'] += 1
+                continue
+            # Dimensioni diverse dal keyframe: il frame diventa un nuovo keyframe
+
+        materialize(change, reaper)
+        keyframe, keyframe_image, since_keyframe = change, None, 0
+        stats['keyframes'] += 1
+
+    for change in recent:
+        # Gli ultimi frame restano completi, anche se la politica è cambiata
+        materialize(change, reaper)
+        stats['kept_full'] += 1
+
+    for change in pruned:
+        reaper.release(change.screenshot_key, 'full')
+        reaper.release(change.delta_key, 'delta')
+        change.screenshot_key = None
+        change.delta_key = None
+        change.delta_base_id = None
+        stats['pruned'] += 1
+
+    db.session.commit()
+    return stats
+
+
+def materialize(change, reaper):
+    if not change.delta_key:
+        return
+    # L'immagine ricostruita ha gli stessi pixel dell'originale: resta sotto screenshot_key
+    BlobStore.getInstance().put_as(change.screenshot_key, load_screenshot(change))
+    reaper.release(change.delta_key, 'delta')
+    change.delta_key = None
+    change.delta_base_id = None
+
+
+def compact_all(app, reaper, owner='compaction'):
+    config = app.config
+    lease_seconds = config.get('MONITOR_LEASE_SECONDS', 120)
+    pause = config.get('COMPACTION_PAUSE', 0.1)
+    totals = {'areas': 0, 'kept_full': 0, 'keyframes': 0, 'deltas': 0, 'pruned': 0}
+    with app.app_context():
+        area_ids = [row.id for row in db.session.query(MonitoredArea.id).order_by(MonitoredArea.id)]
+        for area_id in area_ids:
+            # Il lease tiene lontano il monitor mentre la storia dell'area viene riscritta
+            if not acquire_lease(owner, area_id, datetime.now(), lease_seconds):
+                continue
+            try:
+                ma = db.session.get(MonitoredArea, area_id)
+                if ma is not None:
+                    stats = compact_area(ma, retention_policy(ma, db.session.get(User, ma.user_id)), reaper)
+                    totals['areas'] += 1
+                    for key, value in stats.items():
+                        totals[key] += value
+            except Exception as e:
+                db.session.rollback()
+                Logger.getInstance().log(f"Error compacting area {area_id}: {e}", level='error', area_id=area_id,
+                                         traceback=traceback.format_exc())
+            finally:
+                release_leases(owner, [area_id])
+                db.session.remove()
+            time.sleep(pause)
+        totals['blobs_deleted'] = reaper.collect()
+        db.session.remove()
+    Logger.getInstance().log(f"Compaction finished: {totals}", **totals)
+    return totals
+
+
+# Thread in background nel processo worker, separato dal ciclo del monitor
+def start_compaction(app, owner):
+    reaper = BlobReaper(app.config.get('COMPACTION_BLOB_GRACE', 600))
+
+    def loop():
+        while True:
+            try:
+                compact_all(app, reaper, owner)
+            except Exception as e:
+                Logger.getInstance().log(f"Compaction failed: {e}", level='error',
+                                         traceback=traceback.format_exc())
+            time.sleep(app.config.get('COMPACTION_INTERVAL', 3600))
+
+    thread = Thread(target=loop, name='compaction')
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def main():
+    from . import create_app
+    app = create_app(start_monitor=False)
+    reaper = BlobReaper()
+    compact_all(app, reaper)
+    # Esecuzione una tantum: i blob rilasciati vengono cancellati subito
+    with app.app_context():
+        reaper.collect(force=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import math
+import cv2
+import numpy as np
+from skimage.metrics import structural_similarity as ssim
+
+
+def to_gray(image):
+    if image.ndim == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return image
+
+
+def _tile_ssim(before_tile, after_tile):
+    win_size = min(7, *before_tile.shape)
+    if win_size % 2 == 0:
+        win_size -= 1
+    if win_size < 3:
+        # Tile troppo piccola per l'SSIM: si usa la differenza media normalizzata
+        return 1.0 - float(cv2.absdiff(before_tile, after_tile).mean()) / 255.0
+    return float(ssim(before_tile, after_tile, win_size=win_size, data_range=255))
+
+
+def _regions(mask, tile_size, width, height):
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    regions = []
+    for label in range(1, count):
+        x, y, w, h = stats[label][:4]
+        x0, y0 = int(x * tile_size), int(y * tile_size)
+        x1, y1 = min(int((x + w) * tile_size), width), min(int((y + h) * tile_size), height)
+        regions.append([x0, y0, x1 - x0, y1 - y0])
+    return regions
+
+
+# Confronto multi-risoluzione: la piramide individua le tile che differiscono,
+# l'SSIM a piena risoluzione gira solo su quelle e si ferma appena l'area cambiata
+# supera min_changed_area. Le tile candidate non raffinate per l'uscita anticipata
+# vengono comunque riportate tra le regioni cambiate.
+def compare_frames(before, after, ssim_threshold=0.85, tile_size=64, levels=2,
+                   tile_diff_threshold=4.0, min_changed_area=0.005):
+    before = to_gray(before)
+    after = to_gray(after)
+    if after.shape != before.shape:
+        after = cv2.resize(after, (before.shape[1], before.shape[0]), interpolation=cv2.INTER_AREA)
+
+    height, width = before.shape
+    coarse_before, coarse_after = before, after
+    for _ in range(levels):
+        if min(coarse_before.shape) < 16:
+            break
+        coarse_before = cv2.pyrDown(coarse_before)
+        coarse_after = cv2.pyrDown(coarse_after)
+    coarse_diff = cv2.absdiff(coarse_before, coarse_after)
+    scale_y = coarse_diff.shape[0] / height
+    scale_x = coarse_diff.shape[1] / width
+
+    rows, cols = math.ceil(height / tile_size), math.ceil(width / tile_size)
+    candidates = []
+    for row in range(rows):
+        for col in range(cols):
+            cy0, cx0 = int(row * tile_size * scale_y), int(col * tile_size * scale_x)
+            cy1 = max(cy0 + 1, math.ceil(min((row + 1) * tile_size, height) * scale_y))
+            cx1 = max(cx0 + 1, math.ceil(min((col + 1) * tile_size, width) * scale_x))
+            mean_diff = float(coarse_diff[cy0:cy1, cx0:cx1].mean())
+            if mean_diff > tile_diff_threshold:
+                candidates.append((mean_diff, row, col))
+    candidates.sort(reverse=True)
+
+    total_area = height * width
+    mask = np.zeros((rows, cols), dtype=np.uint8)
+    changed_area = 0
+    weighted_score = float(total_area)
+    scored_area = total_area
+    refined = 0
+    early_exit = False
+
+    for index, (_, row, col) in enumerate(candidates):
+        y0, x0 = row * tile_size, col * tile_size
+        y1, x1 = min(y0 + tile_size, height), min(x0 + tile_size, width)
+        tile_area = (y1 - y0) * (x1 - x0)
+        score = _tile_ssim(before[y0:y1, x0:x1], after[y0:y1, x0:x1])
+        refined += 1
+        weighted_score -= tile_area * (1.0 - score)
+        if score < ssim_threshold:
+            mask[row, col] = 1
+            changed_area += tile_area
+            if changed_area / total_area >= min_changed_area:
+                for _, pending_row, pending_col in candidates[index + 1:]:
+                    mask[pending_row, pending_col] = 1
+                    pending_area = (min(tile_size, height - pending_row * tile_size) *
+                                    min(tile_size, width - pending_col * tile_size))
+                    scored_area -= pending_area
+                    weighted_score -= pending_area
+                early_exit = index + 1 < len(candidates)
+                break
+
+    changed_fraction = changed_area / total_area
+    return {
+        'changed': changed_area > 0 and changed_fraction >= min_changed_area,
+        'ssim': weighted_score / scored_area,
+        'changed_fraction': changed_fraction,
+        'regions': _regions(mask, tile_size, width, height),
+        'tiles': rows * cols,
+        'tiles_refined': refined,
+        'early_exit': early_exit,
+    }
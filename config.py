@@ -4,3 +4,73 @@ class Config:
     SECRET_KEY = 'supersecretkey'
     JWT_SECRET_KEY = 'supersecretjwtkey'
     JWT_ACCESS_TOKEN_EXPIRES = 43200  # 12 ore
+
+    # Pool di browser headless condiviso da monitor e validazione
+    BROWSER_POOL_SIZE = 2
+    BROWSER_MAX_PAGES = 100  # pagine servite prima di riciclare un browser
+    BROWSER_HEALTH_CHECK_INTERVAL = 60  # secondi
+    BROWSER_PAGE_LOAD_TIMEOUT = 30  # secondi
+
+    # Esecuzione concorrente dei controlli
+    MONITOR_MAX_WORKERS = 2  # non più di BROWSER_POOL_SIZE
+    MONITOR_PER_HOST_LIMIT = 1
+    MONITOR_CHECK_TIMEOUT = 60  # secondi; oltre, i lease non si rinnovano e il browser del controllo viene chiuso
+    MONITOR_RETRY_DELAY = 60  # secondi prima di riprovare un controllo fallito
+    MONITOR_COALESCE_WINDOW = 15  # secondi di anticipo per unire le aree dello stesso sito
+    MONITOR_SLOW_CHECK_SECONDS = 30  # oltre questa durata il log riporta i tempi di ogni fase
+    MONITOR_LEASE_SECONDS = 120  # durata del lease di un worker su un'area, più di MONITOR_CHECK_TIMEOUT
+    MONITOR_HEARTBEAT_INTERVAL = 30  # secondi tra un rinnovo dei lease e l'altro
+    MONITOR_CLAIM_BATCH = 10  # aree prese per ogni worker libero
+    MONITOR_POLL_INTERVAL = 5  # secondi di attesa quando non ci sono aree scadute
+    WORKER_METRICS_PORT = 9100  # porta per /metrics del worker (metriche dei controlli), None per disattivarla
+
+    # Intervalli adattivi per le aree che li attivano
+    ADAPTIVE_GROWTH = 1.5  # fattore di crescita dopo un controllo senza modifiche
+    ADAPTIVE_MAX_FACTOR = 8  # max_interval predefinito, in multipli di time_interval
+    ADAPTIVE_HISTORY = 5  # modifiche recenti usate per stimare la frequenza di cambiamento
+    ADAPTIVE_REPORT_INTERVAL = 300  # secondi tra un resoconto dei render risparmiati e l'altro
+
+    # Conservazione degli screenshot (valori predefiniti, sovrascrivibili per utente e per area)
+    RETENTION_FULL_FRAMES = 10  # ultimi frame sempre completi
+    RETENTION_KEYFRAME_INTERVAL = 10  # nei frame più vecchi, un keyframe completo ogni N
+    RETENTION_DOWNSAMPLE_HOURS = 24  # oltre gli ultimi frame, al più uno per intervallo (0: tutti)
+    COMPACTION_ENABLED = True
+    COMPACTION_INTERVAL = 3600  # secondi tra un giro di compattazione e l'altro
+    COMPACTION_PAUSE = 0.1  # secondi di pausa tra un'area e l'altra
+    COMPACTION_BLOB_GRACE = 600  # secondi prima di cancellare un blob non più usato
+
+    # Confronto a livelli: distanza di Hamming tra dHash (64 bit) oltre cui l'SSIM viene saltato
+    PHASH_CHANGED_DISTANCE = 12
+
+    # Motore di confronto a tile (SSIM multi-risoluzione)
+    COMPARE_SSIM_THRESHOLD = 0.85  # SSIM di una tile sotto cui è considerata cambiata
+    COMPARE_TILE_SIZE = 64  # pixel
+    COMPARE_PYRAMID_LEVELS = 2  # dimezzamenti per il passaggio a bassa risoluzione
+    COMPARE_TILE_DIFF_THRESHOLD = 4.0  # differenza media (livelli di grigio) per raffinare una tile
+    COMPARE_MIN_CHANGED_AREA = 0.005  # frazione dell'immagine che deve cambiare
+
+    # Archivio delle immagini fuori dal database
+    BLOB_STORE_BACKEND = 'local'
+    BLOB_STORE_ROOT = 'blobs'
+    THUMBNAIL_WIDTHS = (160, 320, 640)  # pixel, generate quando il monitor salva una modifica
+    IMAGE_CACHE_MAX_AGE = 31536000  # secondi
+    DIFF_CACHE_ENTRIES = 64  # immagini di differenza tenute in memoria dall'API
+    DIFF_CACHE_MAX_BYTES = 32 * 1024 * 1024
+    REFERENCE_CACHE_DIR = 'reference_cache'  # frame di riferimento già decodificati (.npy)
+    REFERENCE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+    # Pre-controllo HTTP prima del render in Chrome
+    PRECHECK_TIMEOUT = 10  # secondi
+
+    # Validazione asincrona di POST/PUT /websites
+    VALIDATION_WORKERS = 2  # thread dell'API per i controlli DNS/HTTP
+    VALIDATION_CACHE_TTL = 300  # secondi di cache per DNS e raggiungibilità
+    VALIDATION_HTTP_TIMEOUT = 5  # secondi, controllo HTTP fatto dall'API
+    VALIDATION_POLL_INTERVAL = 2  # secondi tra una ricerca di job in coda e l'altra (worker)
+    VALIDATION_JOB_TIMEOUT = 300  # oltre, un job ancora in esecuzione viene segnato come fallito
+
+    # Attesa adattiva del caricamento della pagina
+    READINESS_TIMEOUT = 10  # secondi massimi, sovrascrivibile per sito (Website.readiness_timeout)
+    READINESS_TIMEOUT_MAX = 60  # valore massimo accettato per Website.readiness_timeout
+    READINESS_IDLE_TIME = 0.5  # secondi senza nuove risorse e senza spostamenti dei selettori
+    READINESS_POLL_INTERVAL = 0.1  # secondi
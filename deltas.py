@@ -0,0 +1,29 @@
+import cv2
+import numpy as np
+
+
+def decode_png(data):
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError("Image could not be decoded")
+    return image
+
+
+def encode_png(image):
+    ok, encoded = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, 9])
+    if not ok:
+        raise ValueError("Image could not be encoded")
+    return encoded.tobytes()
+
+
+# Differenza pixel per pixel modulo 256: dove il frame coincide con il keyframe
+# vale zero, quindi il PNG della differenza si comprime molto più dell'originale.
+# La ricostruzione è esatta (senza perdita).
+def encode_delta(frame, keyframe):
+    if frame.shape != keyframe.shape or frame.dtype != keyframe.dtype:
+        return None
+    return encode_png(frame - keyframe)
+
+
+def apply_delta(keyframe, delta_data):
+    return keyframe + decode_png(delta_data)
@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import cv2
+from flask import current_app
+from .models import db, Difference
+from .blobstore import BlobStore, load_screenshot, load_diff_image
+from .comparison import compare_frames
+from .deltas import decode_png, encode_png
+
+
+# LRU in memoria delle immagini di differenza già codificate, limitata sia nel
+# numero di voci sia nei byte totali
+class DiffCache:
+    _instance = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def getInstance():
+        with DiffCache._lock:
+            if DiffCache._instance is None:
+                config = current_app.config
+                DiffCache(max_entries=config.get('DIFF_CACHE_ENTRIES', 64),
+                          max_bytes=config.get('DIFF_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+            return DiffCache._instance
+
+    def __init__(self, max_entries=64, max_bytes=32 * 1024 * 1024):
+        if DiffCache._instance is not None:
+            raise Exception("This class is a singleton!")
+        DiffCache._instance = self
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._entries_lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key):
+        with self._entries_lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, etag, data):
+        with self._entries_lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key)[1])
+            self._entries[key] = (etag, data)
+            self._size += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def key_lock(self, key):
+        # Richieste contemporanee per la stessa coppia generano la differenza una volta sola
+        with self._entries_lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def release_key_lock(self, key):
+        with self._entries_lock:
+            self._key_locks.pop(key, None)
+
+
+# Immagine della differenza: lo screenshot più recente con le regioni cambiate
+# evidenziate in rosso (stessa risoluzione del precedente, come nel confronto)
+def render_diff(before_png, after_png):
+    config = current_app.config
+    before = decode_png(before_png)[:, :, :3]
+    after = decode_png(after_png)[:, :, :3]
+    if after.shape != before.shape:
+        after = cv2.resize(after, (before.shape[1], before.shape[0]), interpolation=cv2.INTER_AREA)
+    result = compare_frames(before, after,
+                            ssim_threshold=config.get('COMPARE_SSIM_THRESHOLD', 0.85),
+                            tile_size=config.get('COMPARE_TILE_SIZE', 64),
+                            levels=config.get('COMPARE_PYRAMID_LEVELS', 2),
+                            tile_diff_threshold=config.get('COMPARE_TILE_DIFF_THRESHOLD', 4.0),
+                            min_changed_area=0)
+    overlay = after.copy()
+    for x, y, w, h in result['regions']:
+        cv2.rectangle(overlay, (x, y), (x + w, y + h), (0, 0, 255), -1)
+    highlighted = cv2.addWeighted(overlay, 0.25, after, 0.75, 0)
+    for x, y, w, h in result['regions']:
+        cv2.rectangle(highlighted, (x, y), (x + w - 1, y + h - 1), (0, 0, 255), 2)
+    return encode_png(highlighted)
+
+
+# Differenza tra due modifiche, generata solo la prima volta che viene chiesta:
+# cache in memoria, poi righe Difference già salvate, infine il calcolo.
+# Ritorna (etag, byte PNG) oppure None se uno dei due screenshot manca.
+def get_difference(before, after):
+    cache = DiffCache.getInstance()
+    key = (before.id, after.id)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    lock = cache.key_lock(key)
+    with lock:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        try:
+            difference = Difference.query.filter_by(change_id1=before.id, change_id2=after.id).filter(
+                Difference.diff_image_key.isnot(None)).order_by(Difference.id).first()
+            if difference is not None:
+                entry = (difference.diff_image_key, load_diff_image(difference))
+            else:
+                before_png, after_png = load_screenshot(before), load_screenshot(after)
+                if before_png is None or after_png is None:
+                    return None
+                data = render_diff(before_png, after_png)
+                diff_key = BlobStore.getInstance().put(data)
+                db.session.add(Difference(change_id1=before.id, change_id2=after.id, diff_image_key=diff_key,
+                                          created_at=datetime.utcnow()))
+                db.session.commit()
+                entry = (diff_key, data)
+            cache.set(key, *entry)
+            return entry
+        finally:
+            cache.release_key_lock(key)
@@ -0,0 +1,86 @@
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from .logger import Logger
+
+
+# Pool limitato di worker per i controlli delle aree monitorate.
+# Un controllo viene accettato solo se c'è un worker libero e l'host non ha già
+# troppi controlli in corso; altrimenti submit() ritorna False e il controllo
+# viene riproposto al giro successivo.
+class CheckExecutor:
+    def __init__(self, max_workers=4, per_host_limit=1, check_timeout=60):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.check_timeout = check_timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='check')
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._per_host = defaultdict(int)
+        self._reported = set()
+
+    def submit(self, key, host, fn, *args):
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            if len(self._in_flight) >= self.max_workers:
+                return False
+            if self._per_host[host] >= self.per_host_limit:
+                return False
+            self._per_host[host] += 1
+            self._in_flight[key] = (host, time.monotonic())
+
+        try:
+            future = self._pool.submit(fn, *args)
+        except Exception:
+            self._done(key, host, None)
+            raise
+        future.add_done_callback(lambda f: self._done(key, host, f))
+        return True
+
+    def _done(self, key, host, future):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._reported.discard(key)
+            self._per_host[host] -= 1
+            if self._per_host[host] <= 0:
+                del self._per_host[host]
+
+        if future is not None and future.exception() is not None:
+            error = future.exception()
+            Logger.getInstance().log(f"Check {key} failed: {error}", level='error', check=key,
+                                     traceback=''.join(traceback.format_exception(type(error), error,
+                                                                                  error.__traceback__)))
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+    def free_slots(self):
+        with self._lock:
+            return self.max_workers - len(self._in_flight)
+
+    # Controlli in corso entro il timeout: solo per questi il worker rinnova i lease
+    def active_keys(self):
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (host, started) in self._in_flight.items() if now - started <= self.check_timeout]
+
+    # Ogni controllo oltre il timeout viene segnalato una volta sola. Da lì i suoi lease
+    # non vengono più rinnovati (le aree passano a un altro worker) e il BrowserPool
+    # chiude il browser che sta usando: la chiamata al driver bloccata fallisce e lo
+    # slot si libera.
+    def report_overdue(self):
+        now = time.monotonic()
+        with self._lock:
+            overdue = [(key, host, now - started) for key, (host, started) in self._in_flight.items()
+                       if now - started > self.check_timeout and key not in self._reported]
+            self._reported.update(key for key, _, _ in overdue)
+        for key, host, elapsed in overdue:
+            Logger.getInstance().log(f"Check {key} on {host} exceeded timeout ({elapsed:.1f}s)", level='warning',
+                                     check=key, host=host)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
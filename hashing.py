@@ -0,0 +1,20 @@
+import hashlib
+import cv2
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def dhash(image, hash_size=8):
+    # Difference hash: confronta pixel adiacenti di una miniatura in scala di grigi
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    resized = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (resized[:, 1:] > resized[:, :-1]).flatten()
+    value = int(''.join('1' if bit else '0' for bit in bits), 2)
+    return f'{value:0{hash_size * hash_size // 4}x}'
+
+
+def hamming_distance(hash1, hash2):
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count('1')
@@ -0,0 +1,112 @@
+from datetime import timedelta
+from sqlalchemy import and_, or_, update, func
+from .models import db, MonitoredArea, ValidationJob
+
+
+def _due(now, horizon):
+    return and_(or_(MonitoredArea.next_check_at.is_(None), MonitoredArea.next_check_at <= horizon),
+                or_(MonitoredArea.lease_expires_at.is_(None), MonitoredArea.lease_expires_at < now))
+
+
+# Assegna al worker fino a limit aree scadute entro horizon e senza lease valido.
+# Su Postgres le righe vengono bloccate con FOR UPDATE SKIP LOCKED, così worker
+# concorrenti si prendono aree diverse senza aspettarsi; sugli altri database
+# (SQLite nei test) ogni riga viene presa con un UPDATE condizionato, che
+# riesce per un solo worker.
+def claim_due_areas(worker_id, now, horizon, limit, lease_seconds):
+    expires_at = now + timedelta(seconds=lease_seconds)
+    due = _due(now, horizon)
+    candidates = db.session.query(MonitoredArea.id).filter(due).order_by(
+        MonitoredArea.next_check_at.asc().nullsfirst()).limit(limit)
+
+    if db.engine.dialect.name == 'postgresql':
+        claimed = [row.id for row in candidates.with_for_update(skip_locked=True)]
+        if claimed:
+            db.session.execute(update(MonitoredArea).where(MonitoredArea.id.in_(claimed)).values(
+                lease_owner=worker_id, lease_expires_at=expires_at))
+        db.session.commit()
+        return claimed
+
+    claimed = []
+    for area_id in [row.id for row in candidates]:
+        result = db.session.execute(update(MonitoredArea).where(MonitoredArea.id == area_id, due).values(
+            lease_owner=worker_id, lease_expires_at=expires_at))
+        if result.rowcount == 1:
+            claimed.append(area_id)
+    db.session.commit()
+    return claimed
+
+
+# Heartbeat: estende i lease del worker sulle aree dei siti indicati, cioè dei
+# controlli in corso e non ancora oltre il timeout. Quelli bloccati (es. in una
+# chiamata al driver) smettono di essere rinnovati: il lease scade e un altro
+# worker riprende le aree.
+def renew_leases(worker_id, now, lease_seconds, website_ids):
+    if not website_ids:
+        return 0
+    result = db.session.execute(update(MonitoredArea).where(
+        MonitoredArea.lease_owner == worker_id, MonitoredArea.website_id.in_(website_ids)).values(
+        lease_expires_at=now + timedelta(seconds=lease_seconds)))
+    db.session.commit()
+    return result.rowcount
+
+
+def release_leases(worker_id, area_ids, next_check_at=None):
+    values = {'lease_owner': None, 'lease_expires_at': None}
+    if next_check_at is not None:
+        values['next_check_at'] = next_check_at
+    db.session.execute(update(MonitoredArea).where(MonitoredArea.id.in_(area_ids),
+                                                   MonitoredArea.lease_owner == worker_id).values(**values))
+    db.session.commit()
+
+
+# Prossima scadenza tra le aree senza lease valido (None se non ce ne sono): il
+# worker dorme fino a lì invece di interrogare il database a ogni giro
+def next_due_at(now):
+    free = or_(MonitoredArea.lease_expires_at.is_(None), MonitoredArea.lease_expires_at < now)
+    if db.session.query(MonitoredArea.id).filter(free, MonitoredArea.next_check_at.is_(None)).first():
+        return now
+    return db.session.query(func.min(MonitoredArea.next_check_at)).filter(free).scalar()
+
+
+def count_due_areas(now):
+    return db.session.query(func.count(MonitoredArea.id)).filter(_due(now, now)).scalar()
+
+
+# Lease preso fuori dal ciclo del monitor (es. compattazione): riesce solo se
+# l'area non è in controllo, e finché dura nessun worker la prende in carico
+def acquire_lease(owner, area_id, now, lease_seconds):
+    result = db.session.execute(update(MonitoredArea).where(
+        MonitoredArea.id == area_id,
+        or_(MonitoredArea.lease_expires_at.is_(None), MonitoredArea.lease_expires_at < now)).values(
+        lease_owner=owner, lease_expires_at=now + timedelta(seconds=lease_seconds)))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+# Prende il ValidationJob in coda più vecchio: l'UPDATE condizionato sullo stato
+# riesce per un solo worker, su Postgres come su SQLite
+def claim_validation_job(now):
+    candidates = db.session.query(ValidationJob.id).filter(ValidationJob.status == 'queued').order_by(
+        ValidationJob.created_at).limit(5)
+    for job_id in [row.id for row in candidates]:
+        result = db.session.execute(update(ValidationJob).where(
+            ValidationJob.id == job_id, ValidationJob.status == 'queued').values(status='running', started_at=now))
+        if result.rowcount == 1:
+            db.session.commit()
+            return job_id
+    db.session.commit()
+    return None
+
+
+# Job rimasti in 'running' dopo la morte del worker che li eseguiva, o in 'pending'
+# dopo il riavvio del processo API che li controllava (il suo pool è in memoria):
+# falliscono, rieseguirli potrebbe creare due volte la stessa area
+def fail_stale_validation_jobs(now, timeout):
+    stale_before = now - timedelta(seconds=timeout)
+    result = db.session.execute(update(ValidationJob).where(or_(
+        and_(ValidationJob.status == 'running', ValidationJob.started_at < stale_before),
+        and_(ValidationJob.status == 'pending', ValidationJob.created_at < stale_before))).values(
+        status='failed', message='Validation timed out', finished_at=now))
+    db.session.commit()
+    return result.rowcount
@@ -1,7 +1,30 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
-from datetime import date
+import queue
+from datetime import datetime, timezone
 
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# I messaggi passano da una coda in memoria: chi chiama log() non aspetta mai il
+# disco, la scrittura (con rotazione giornaliera o per dimensione) la fa un thread
+# in background. Configurabile con le variabili d'ambiente LOG_*.
 class Logger:
     _instance = None
 
@@ -16,32 +39,37 @@ class Logger:
             raise Exception("This class is a singleton!")
         else:
             Logger._instance = self
-            self.logger = logging.getLogger(__name__)
-            self.logger.setLevel(logging.INFO)
+            self.logger = logging.getLogger('webmonitor')
+            self.logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+            self.logger.propagate = False
 
-            log_dir = 'log'
+            log_dir = os.environ.get('LOG_DIR', 'log')
             try:
                 if not os.path.exists(log_dir):
                     os.makedirs(log_dir)
             except Exception as e:
                 raise Exception(f"Failed to create log directory: {e}")
 
-            log_file = f'{log_dir}/{date.today()}.log'
+            log_file = os.path.join(log_dir, 'webmonitor.log')
+            backup_count = int(os.environ.get('LOG_BACKUP_COUNT', 14))
             try:
-                handler = logging.FileHandler(log_file)
+                if os.environ.get('LOG_ROTATION', 'daily') == 'size':
+                    handler = logging.handlers.RotatingFileHandler(
+                        log_file, maxBytes=int(os.environ.get('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+                        backupCount=backup_count)
+                else:
+                    handler = logging.handlers.TimedRotatingFileHandler(
+                        log_file, when='midnight', backupCount=backup_count)
             except Exception as e:
                 raise Exception(f"Failed to create log file: {e}")
 
-            handler.setLevel(logging.INFO)
-
-            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-            handler.setFormatter(formatter)
+            handler.setFormatter(JsonFormatter())
 
-            self.logger.addHandler(handler)
+            log_queue = queue.SimpleQueue()
+            self.logger.addHandler(logging.handlers.QueueHandler(log_queue))
+            self.listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.listener.stop)
 
-    def log(self, message):
-        print(f"Logging message: {message}")  # Debug print
-        try:
-            self.logger.info(message)
-        except Exception as e:
-            print(f"Failed to write to log file: {e}")  # Debug print
\ No newline at end of file
+    def log(self, message, level='info', **context):
+        self.logger.log(logging.getLevelName(level.upper()), message, extra={'context': context})
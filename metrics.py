@@ -0,0 +1,164 @@
+import threading
+import time
+from contextlib import contextmanager
+from .logger import Logger
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+# Metriche minime in formato testo Prometheus, senza dipendenze esterne.
+# Ogni metrica tiene una serie per combinazione di etichette.
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {} if self.labelnames or self.kind == 'histogram' else {(): 0}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Counter):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, series['buckets']):
+                    samples.append((f'{self.name}_bucket', key + (('le', _format_value(bound)),), count))
+                samples.append((f'{self.name}_sum', key, series['sum']))
+                samples.append((f'{self.name}_count', key, series['count']))
+        return samples
+
+
+# Registro delle metriche della pipeline di monitoraggio.
+# stage() misura una fase del controllo; se il thread sta eseguendo un controllo
+# dentro trace(), la durata viene anche aggiunta alla traccia, che viene scritta
+# nel log quando il controllo supera la soglia di lentezza.
+class Metrics:
+    _instance = None
+    _lock = threading.Lock()
+
+    STAGES = ('precheck', 'browser_acquire', 'page_load', 'readiness_wait', 'screenshot', 'decode', 'compare',
+              'db_commit')
+
+    @staticmethod
+    def getInstance():
+        with Metrics._lock:
+            if Metrics._instance is None:
+                Metrics()
+            return Metrics._instance
+
+    def __init__(self):
+        if Metrics._instance is not None:
+            raise Exception("This class is a singleton!")
+        Metrics._instance = self
+        self.stage_seconds = Histogram('webmonitor_check_stage_seconds',
+                                       'Duration of each stage of a website check', ['stage'])
+        self.check_seconds = Histogram('webmonitor_check_seconds', 'Total duration of a website check')
+        self.scheduler_lag_seconds = Histogram('webmonitor_scheduler_lag_seconds',
+                                               'Delay between the scheduled and the actual start of an area check',
+                                               buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0))
+        self.queue_depth = Gauge('webmonitor_queue_depth', 'Areas past their deadline and not yet started')
+        self.checks_in_flight = Gauge('webmonitor_checks_in_flight', 'Website checks currently running')
+        self.area_checks = Counter('webmonitor_area_checks_total', 'Area checks by outcome', ['result'])
+        self.comparison_tiers = Counter('webmonitor_comparison_tier_total',
+                                        'Comparison tier that decided each check', ['tier'])
+        self.slow_checks = Counter('webmonitor_slow_checks_total', 'Checks slower than the trace threshold')
+        self.renders_saved = Gauge('webmonitor_renders_saved_per_hour',
+                                   'Renders per hour avoided by adaptive intervals')
+        self._metrics = [self.stage_seconds, self.check_seconds, self.scheduler_lag_seconds, self.queue_depth,
+                         self.checks_in_flight, self.area_checks, self.comparison_tiers, self.slow_checks,
+                         self.renders_saved]
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stage_seconds.observe(elapsed, stage=name)
+            trace = getattr(self._local, 'trace', None)
+            if trace is not None:
+                trace[name] = trace.get(name, 0.0) + elapsed
+
+    @contextmanager
+    def trace(self, slow_threshold=None, **context):
+        self._local.trace = trace = {}
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._local.trace = None
+            self.check_seconds.observe(elapsed)
+            if slow_threshold is not None and elapsed >= slow_threshold:
+                self.slow_checks.inc()
+                Logger.getInstance().log(f"Slow check: {elapsed:.2f}s", level='warning', duration=round(elapsed, 3),
+                                         stages={name: round(value, 3) for name, value in trace.items()},
+                                         **context)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
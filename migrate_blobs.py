@@ -0,0 +1,41 @@
+from . import create_app
+from .models import db, Change, Difference
+from .blobstore import BlobStore
+from .logger import Logger
+
+BATCH_SIZE = 100
+
+
+# Migrazione una tantum: sposta i PNG ancora salvati in Change.screenshot e
+# Difference.diff_image nel BlobStore, lasciando nel database solo la chiave.
+# Si può interrompere e rilanciare: ogni lotto è committato separatamente.
+def migrate(model, data_column, key_column):
+    store = BlobStore.getInstance()
+    moved = 0
+    while True:
+        rows = model.query.filter(data_column.isnot(None)).order_by(model.id).limit(BATCH_SIZE).all()
+        if not rows:
+            break
+        for row in rows:
+            data = getattr(row, data_column.key)
+            key = store.put(data)
+            setattr(row, key_column.key, key)
+            setattr(row, data_column.key, None)
+            if model is Change and row.content_hash is None:
+                row.content_hash = key
+        db.session.commit()
+        db.session.expunge_all()
+        moved += len(rows)
+        Logger.getInstance().log(f"Moved {moved} {model.__tablename__} blobs to the blob store")
+    return moved
+
+
+def main():
+    app = create_app(start_monitor=False)
+    with app.app_context():
+        migrate(Change, Change.screenshot, Change.screenshot_key)
+        migrate(Difference, Difference.diff_image, Difference.diff_image_key)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+from sqlalchemy import MetaData, inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from . import db
+from .logger import Logger
+
+MIGRATION_LOCK_ID = 7305411  # chiave dell'advisory lock di Postgres
+
+
+# API e worker partono insieme: su Postgres un advisory lock fa eseguire le
+# migrazioni a un processo alla volta, gli altri trovano lo schema già aggiornato
+def migrate():
+    engine = db.engine
+    if engine.dialect.name != 'postgresql':
+        try:
+            db.create_all()
+        except OperationalError:
+            # Tabella creata nel frattempo da un altro processo: il secondo giro la trova
+            db.create_all()
+        upgrade()
+        return
+    with engine.connect() as connection:
+        connection.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+        try:
+            db.create_all()
+            upgrade()
+        finally:
+            connection.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+            connection.commit()
+
+
+def run_ddl(engine, statement):
+    with engine.begin() as connection:
+        connection.execute(statement)
+
+
+# Esegue il DDL; se fallisce perché un altro processo ha appena creato lo stesso
+# oggetto (exists() lo ritrova) l'errore viene ignorato
+def execute_ddl(create, exists):
+    try:
+        create()
+        return True
+    except (OperationalError, ProgrammingError):
+        if exists():
+            return False
+        raise
+
+
+# db.create_all() crea solo le tabelle mancanti: qui si aggiungono a quelle
+# esistenti le colonne e gli indici introdotti successivamente nei modelli.
+def upgrade():
+    engine = db.engine
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing_columns = {column['name']: column for column in inspector.get_columns(table.name)}
+        rebuild = False
+        for column in table.columns:
+            if column.name in existing_columns:
+                # Colonne rese facoltative nel modello
+                if column.nullable and not existing_columns[column.name]['nullable']:
+                    if engine.dialect.name == 'sqlite':
+                        # SQLite non supporta ALTER COLUMN: la tabella viene ricostruita
+                        rebuild = True
+                        continue
+                    with engine.begin() as connection:
+                        connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ALTER COLUMN "
+                                                f"{preparer.format_column(column)} DROP NOT NULL"))
+                    Logger.getInstance().log(f"Dropped NOT NULL on {table.name}.{column.name}")
+                continue
+            if_not_exists = 'IF NOT EXISTS ' if engine.dialect.name == 'postgresql' else ''
+            ddl = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {if_not_exists}"
+                   f"{preparer.format_column(column)} {column.type.compile(dialect=engine.dialect)}")
+            if column.server_default is not None:
+                default = column.server_default.arg
+                ddl += f" DEFAULT {default.text if hasattr(default, 'text') else repr(str(default))}"
+            if execute_ddl(lambda: run_ddl(engine, text(ddl)),
+                           lambda: column.name in {c['name'] for c in inspect(engine).get_columns(table.name)}):
+                Logger.getInstance().log(f"Added column {table.name}.{column.name}")
+
+        if rebuild:
+            rebuild_sqlite_table(engine, table)
+
+        if engine.dialect.name == 'sqlite' and table.name == 'change':
+            # Righe salvate con il vecchio default CURRENT_TIMESTAMP, senza microsecondi:
+            # si portano al formato scritto da SQLAlchemy, così i confronti restano coerenti
+            with engine.begin() as connection:
+                result = connection.execute(text(
+                    f"UPDATE {preparer.format_table(table)} SET change_detected_at = change_detected_at || '.000000' "
+                    f"WHERE length(change_detected_at) = 19"))
+            if result.rowcount:
+                Logger.getInstance().log(f"Normalized change_detected_at on {result.rowcount} rows")
+
+        existing_indexes = {index['name'] for index in inspect(engine).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                if execute_ddl(lambda: run_ddl(engine, CreateIndex(index, if_not_exists=True)),
+                               lambda: index.name in {i['name'] for i in inspect(engine).get_indexes(table.name)}):
+                    Logger.getInstance().log(f"Created index {index.name}")
+
+
+# Procedura indicata da SQLite per cambiare i vincoli di una tabella: nuova tabella
+# con lo schema del modello, copia delle righe, sostituzione. Tutto in una sola
+# transazione, così un altro processo trova la tabella vecchia o quella nuova.
+# Gli indici spariscono con la tabella vecchia e vengono ricreati da upgrade().
+def rebuild_sqlite_table(engine, table):
+    preparer = engine.dialect.identifier_preparer
+    scratch = MetaData()
+    for referenced in {foreign_key.column.table for foreign_key in table.foreign_keys} - {table}:
+        referenced.to_metadata(scratch)
+    new_table = table.to_metadata(scratch, name=f'{table.name}__rebuild')
+    columns = ', '.join(preparer.format_column(column) for column in table.columns)
+    with engine.begin() as connection:
+        connection.execute(CreateTable(new_table))
+        connection.execute(text(f"INSERT INTO {preparer.format_table(new_table)} ({columns}) "
+                                f"SELECT {columns} FROM {preparer.format_table(table)}"))
+        connection.execute(text(f"DROP TABLE {preparer.format_table(table)}"))
+        connection.execute(text(f"ALTER TABLE {preparer.format_table(new_table)} "
+                                f"RENAME TO {preparer.format_table(table)}"))
+    Logger.getInstance().log(f"Rebuilt table {table.name} to drop NOT NULL constraints")
@@ -1,18 +1,30 @@
+import json
 from datetime import datetime, timedelta
 from . import db
 
 
+COMPARE_MODES = ('visual', 'text', 'html')
+TEXT_COMPARE_MODES = ('text', 'html')
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password = db.Column(db.String(200), nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
+    # Politica di conservazione predefinita per le aree dell'utente (None: valori di Config)
+    retention_full_frames = db.Column(db.Integer, nullable=True)
+    retention_keyframe_interval = db.Column(db.Integer, nullable=True)
+    retention_downsample_hours = db.Column(db.Integer, nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
 
 class Website(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String(200), unique=True, nullable=False)
+    # Disattivare per i siti renderizzati lato client, dove l'HTML statico non cambia
+    precheck_enabled = db.Column(db.Boolean, nullable=False, default=True, server_default=db.text('true'))
+    readiness_timeout = db.Column(db.Integer, nullable=True)  # secondi, sostituisce READINESS_TIMEOUT
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
 
@@ -23,7 +35,25 @@ class MonitoredArea(db.Model):
     name = db.Column(db.String(100), nullable=False)
     area_selector = db.Column(db.String(500), nullable=False)
     time_interval = db.Column(db.Integer, nullable=False, default=60)
+    # Intervallo adattivo (minuti): effective_interval è quello usato davvero dal monitor
+    adaptive_interval = db.Column(db.Boolean, nullable=False, default=False, server_default=db.text('false'))
+    min_interval = db.Column(db.Integer, nullable=True)
+    max_interval = db.Column(db.Integer, nullable=True)
+    effective_interval = db.Column(db.Integer, nullable=True)
+    compare_mode = db.Column(db.String(10), nullable=False, default='visual', server_default='visual')
     last_change_checked = db.Column(db.DateTime, nullable=True)
+    next_check_at = db.Column(db.DateTime, nullable=True, index=True)
+    # Stato del pre-controllo HTTP all'ultimo render
+    http_etag = db.Column(db.String(200), nullable=True)
+    http_last_modified = db.Column(db.String(100), nullable=True)
+    html_hash = db.Column(db.String(64), nullable=True)
+    # Lease del worker che sta controllando l'area; scaduto, l'area torna disponibile
+    lease_owner = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True, index=True)
+    # Politica di conservazione dell'area, prevale su quella dell'utente
+    retention_full_frames = db.Column(db.Integer, nullable=True)
+    retention_keyframe_interval = db.Column(db.Integer, nullable=True)
+    retention_downsample_hours = db.Column(db.Integer, nullable=True)
 
     website = db.relationship('Website', backref=db.backref('monitored_areas', lazy=True))
     changes = db.relationship('Change', back_populates='monitored_area', cascade="all, delete-orphan")
@@ -40,18 +70,38 @@ class MonitoredArea(db.Model):
             'name': self.name,
             'area_selector': self.area_selector,
             'time_interval': self.time_interval,
+            'adaptive_interval': self.adaptive_interval,
+            'min_interval': self.min_interval,
+            'max_interval': self.max_interval,
+            'effective_interval': self.effective_interval,
+            'compare_mode': self.compare_mode,
             'last_change_checked': self.last_change_checked.isoformat() if self.last_change_checked else None,
+            'next_check_at': self.next_check_at.isoformat() if self.next_check_at else None,
             'changes': [change.to_dict() for change in self.changes]
         }
 
 
 class Change(db.Model):
+    __table_args__ = (
+        db.Index('ix_change_area_detected', 'monitored_area_id', 'change_detected_at'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     monitored_area_id = db.Column(db.Integer, db.ForeignKey('monitored_area.id'), nullable=False)
-    change_detected_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # Impostato in Python: su SQLite CURRENT_TIMESTAMP non ha i microsecondi e il cursore
+    # di GET /changes (confronto tra stringhe) non ritroverebbe la riga da cui riprendere
+    change_detected_at = db.Column(db.DateTime, default=datetime.now)
     change_snapshot = db.Column(db.Text, nullable=False)
     change_summary = db.Column(db.Text)
-    screenshot = db.Column(db.LargeBinary, nullable=False)
+    screenshot = db.Column(db.LargeBinary, nullable=True)  # solo righe precedenti al BlobStore
+    screenshot_key = db.Column(db.String(64), nullable=True, index=True)
+    # Frame compattati: differenza rispetto allo screenshot del keyframe delta_base_id.
+    # screenshot_key resta l'identità dell'immagine (ETag, miniature).
+    delta_key = db.Column(db.String(64), nullable=True, index=True)
+    delta_base_id = db.Column(db.Integer, db.ForeignKey('change.id'), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)
+    perceptual_hash = db.Column(db.String(16), nullable=True)
+    changed_regions = db.Column(db.Text, nullable=True)  # JSON: [[x, y, w, h], ...]
     reviewed = db.Column(db.Boolean, default=False)
 
     monitored_area = db.relationship('MonitoredArea', back_populates='changes')
@@ -68,6 +118,11 @@ class Change(db.Model):
             'change_snapshot': self.change_snapshot,
             'change_summary': self.change_summary,
             'screenshot': self.screenshot.decode('utf-8') if self.screenshot else None,
+            'screenshot_key': self.screenshot_key,
+            'delta_base_id': self.delta_base_id,
+            'content_hash': self.content_hash,
+            'perceptual_hash': self.perceptual_hash,
+            'changed_regions': json.loads(self.changed_regions) if self.changed_regions else [],
             'reviewed': self.reviewed,
             'differences1': [difference.to_dict() for difference in self.differences1],
             'differences2': [difference.to_dict() for difference in self.differences2]
@@ -75,10 +130,15 @@ class Change(db.Model):
 
 
 class Difference(db.Model):
+    __table_args__ = (
+        db.Index('ix_difference_pair', 'change_id1', 'change_id2'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     change_id1 = db.Column(db.Integer, db.ForeignKey('change.id'), nullable=False)
     change_id2 = db.Column(db.Integer, db.ForeignKey('change.id'), nullable=False)
-    diff_image = db.Column(db.LargeBinary, nullable=False)
+    diff_image = db.Column(db.LargeBinary, nullable=True)  # solo righe precedenti al BlobStore
+    diff_image_key = db.Column(db.String(64), nullable=True, index=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
     change1 = db.relationship('Change', foreign_keys=[change_id1], back_populates='differences1')
@@ -90,5 +150,31 @@ class Difference(db.Model):
             'change_id1': self.change_id1,
             'change_id2': self.change_id2,
             'diff_image': self.diff_image.decode('utf-8') if self.diff_image else None,
+            'diff_image_key': self.diff_image_key,
             'created_at': self.created_at.isoformat()
         }
+
+
+class ValidationJob(db.Model):
+    id = db.Column(db.String(36), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    action = db.Column(db.String(10), nullable=False)  # 'create' o 'update'
+    monitored_area_id = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    # pending (controlli DNS/HTTP dell'API), queued (in attesa di un worker), running, succeeded, failed
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)  # preso in carico da un worker
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'action': self.action,
+            'monitored_area_id': self.monitored_area_id,
+            'status': self.status,
+            'message': self.message,
+            'created_at': self.created_at.isoformat(),
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
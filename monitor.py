@@ -1,203 +1,516 @@
 from datetime import datetime, timedelta
-from threading import Thread
-from selenium.common.exceptions import WebDriverException
-from selenium import webdriver
+from threading import Thread, Lock
+import os
+import socket
 import time
+import uuid
+from urllib.parse import urlparse
+from selenium.common.exceptions import WebDriverException, NoSuchElementException, InvalidSelectorException
+from selenium.webdriver.common.by import By
 from flask import current_app
 import cv2
-from PIL import Image
-from io import BytesIO
 import traceback
-from logger import Logger
+import json
+import difflib
+from .logger import Logger
 import numpy as np
 
-from .models import db, Change, MonitoredArea, Difference
-from skimage.metrics import structural_similarity as ssim
+from .models import db, Change, MonitoredArea, TEXT_COMPARE_MODES
+from .browser_pool import BrowserPool
+from .executor import CheckExecutor
+from .leases import claim_due_areas, renew_leases, release_leases, count_due_areas, next_due_at
+from .blobstore import BlobStore, load_screenshot
+from .thumbnails import store_thumbnails
+from .hashing import content_hash, dhash, hamming_distance
+from sqlalchemy import or_
+from sqlalchemy.orm import joinedload, defer
+from .comparison import compare_frames, to_gray
+from .reference_cache import ReferenceCache
+from .readiness import wait_until_ready
+from .precheck import HttpPrecheck, FULL_PAGE_SELECTORS, sanitize_html
+from .metrics import Metrics
+from .adaptive import update_interval, renders_saved_per_hour
 
 def start_async_monitor():
-    print("Starting monitor thread")
     app = current_app._get_current_object()
-    monitor_thread = Thread(target=async_monitor, args=(app,))
+    monitor_thread = Thread(target=run_worker, args=(app,))
     monitor_thread.daemon = True
     monitor_thread.start()
-    print("Monitor thread started")
+    Logger.getInstance().log("Monitor thread started")
 
 
 def accept_cookies(driver):
     return
 
 
-def take_screenshot(url):
-    options = webdriver.ChromeOptions()
-    options.add_argument('--headless')
-    options.add_argument('--no-sandbox')
-    options.add_argument('--disable-dev-shm-usage')
-    options.add_argument('--disable-gpu')
-    options.add_argument('--window-size=1920,1080')
+def capture_element(driver, url, selector, compare_mode='visual'):
+    # Un elemento che non si riesce a catturare (nascosto, altezza zero, non più nel DOM)
+    # fa fallire solo la propria area, non le altre aree dello stesso sito
+    try:
+        return read_element(driver, url, selector, compare_mode)
+    except WebDriverException as e:
+        Logger.getInstance().log(f"Could not capture '{selector}' on {url}: {e.msg}", level='warning', url=url,
+                                 selector=selector)
+        return None
 
-    driver = webdriver.Chrome(options=options)
 
+def read_element(driver, url, selector, compare_mode):
+    if selector is None or selector.strip().lower() in FULL_PAGE_SELECTORS:
+        element = None
+        screenshot = driver.get_screenshot_as_png()
+    else:
+        # Cattura solo il riquadro dell'elemento indicato dall'utente
+        try:
+            element = driver.find_element(By.CSS_SELECTOR, selector)
+        except NoSuchElementException:
+            Logger.getInstance().log(f"Selector '{selector}' not found on {url}", level='warning', url=url,
+                                 selector=selector)
+            return None
+        except InvalidSelectorException:
+            Logger.getInstance().log(f"Invalid selector '{selector}' for {url}", level='warning', url=url,
+                                 selector=selector)
+            return None
+        screenshot = element.screenshot_as_png
+
+    if compare_mode in TEXT_COMPARE_MODES and element is None:
+        element = driver.find_element(By.TAG_NAME, 'body')
+    if compare_mode == 'text':
+        return {'screenshot': screenshot, 'text': element.text}
+    if compare_mode == 'html':
+        return {'screenshot': screenshot, 'text': sanitize_html(element.get_attribute('outerHTML'))}
+    return {'screenshot': screenshot}
+
+
+def wait_for_page(driver, url, selectors, readiness_timeout=None):
+    config = current_app.config
+    timeout = config.get('READINESS_TIMEOUT', 10)
+    if isinstance(readiness_timeout, int) and readiness_timeout > 0:
+        # Valori salvati prima della validazione dell'API: ignorati se non validi, sempre limitati
+        timeout = min(readiness_timeout, config.get('READINESS_TIMEOUT_MAX', 60))
+    waited, ready = wait_until_ready(driver,
+                                     [selector for selector in selectors
+                                      if selector and selector.strip().lower() not in FULL_PAGE_SELECTORS],
+                                     timeout=timeout,
+                                     idle_time=config.get('READINESS_IDLE_TIME', 0.5),
+                                     poll_interval=config.get('READINESS_POLL_INTERVAL', 0.1))
+    Logger.getInstance().log(f"Page {url} {'ready' if ready else 'not ready'} after {waited:.2f}s "
+                             f"(ceiling {timeout}s)", url=url, readiness_wait=round(waited, 3), ready=ready)
+    return waited, ready
+
+
+def capture_page(url, targets, page_load_timeout=None, readiness_timeout=None):
+    # Un solo caricamento della pagina per tutte le coppie (selettore, modalità) richieste
     try:
-        driver.get(url)
+        with BrowserPool.getInstance().page(page_load_timeout=page_load_timeout,
+                                            timeout=page_load_timeout) as driver:
+            metrics = Metrics.getInstance()
+            with metrics.stage('page_load'):
+                driver.get(url)
+            with metrics.stage('readiness_wait'):
+                wait_for_page(driver, url, {selector for selector, _ in targets}, readiness_timeout)
+            with metrics.stage('screenshot'):
+                return {(selector, compare_mode): capture_element(driver, url, selector, compare_mode)
+                        for selector, compare_mode in targets}
     except WebDriverException as e:
-        Logger.getInstance().log(f"URL access denied: {e.msg}")
-        driver.quit()
-        return None, None
+        Logger.getInstance().log(f"URL access denied: {e.msg}", level='warning', url=url)
+        return {}
+    except TimeoutError as e:
+        Logger.getInstance().log(f"Browser pool exhausted: {e}", level='warning', url=url)
+        return {}
 
-    time.sleep(2)
 
-    screenshot_path = 'current_screenshot.png'
-    driver.save_screenshot(screenshot_path)
-    driver.quit()
+def take_screenshot(url, selector=None, page_load_timeout=None):
+    captured = capture_page(url, [(selector, 'visual')], page_load_timeout).get((selector, 'visual'))
+    return captured['screenshot'] if captured else None
 
-    with open(screenshot_path, "rb") as image_file:
-        return image_file.read(), screenshot_path
 
+def decode_image(image_bytes):
+    with Metrics.getInstance().stage('decode'):
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Image could not be decoded")
+    return image
 
-def save_image_to_disk(image_bytes, filename):
-    image = Image.open(BytesIO(image_bytes))
-    image.save(filename)
-    return filename
 
-def compare_images(img1_path, img2_path):
+def compare_images(img1, img2):
     try:
-        img1 = cv2.imread(img1_path)
-        img2 = cv2.imread(img2_path)
+        config = current_app.config
+        result = compare_frames(img1, img2,
+                                ssim_threshold=config.get('COMPARE_SSIM_THRESHOLD', 0.85),
+                                tile_size=config.get('COMPARE_TILE_SIZE', 64),
+                                levels=config.get('COMPARE_PYRAMID_LEVELS', 2),
+                                tile_diff_threshold=config.get('COMPARE_TILE_DIFF_THRESHOLD', 4.0),
+                                min_changed_area=config.get('COMPARE_MIN_CHANGED_AREA', 0.005))
+        Logger.getInstance().log(f"SSIM Score: {result['ssim']} ({result['tiles_refined']}/{result['tiles']} tiles "
+                                 f"refined, {len(result['regions'])} changed regions)")
+
+        return result['changed'], {
+            'before': img1,
+            'after': img2,
+            'ssim': result['ssim'],
+            'regions': result['regions'],
+        }
+    except Exception as e:
+        # Log the error and its traceback
+        Logger.getInstance().log(f"Error comparing images: {e}", level='error', traceback=traceback.format_exc())
+        return False, None
 
-        if img1 is None or img2 is None:
-            raise ValueError("One of the images could not be loaded. Please check the paths.")
 
-        img1_gray = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
-        img2_gray = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
+class ComparisonStats:
+    # Conta quale livello del confronto ha deciso ogni controllo, per tarare le soglie
+    TIERS = ('exact', 'phash_changed', 'ssim', 'text')
 
-        if img1_gray.shape != img2_gray.shape:
-            img2_gray = cv2.resize(img2_gray, (img1_gray.shape[1], img1_gray.shape[0]))
+    def __init__(self, log_every=100):
+        self.log_every = log_every
+        self._counts = dict.fromkeys(self.TIERS, 0)
+        self._lock = Lock()
 
-        img1_array = np.array(img1_gray, dtype=np.float32)
-        img2_array = np.array(img2_gray, dtype=np.float32)
+    def record(self, tier):
+        with self._lock:
+            self._counts[tier] += 1
+            Metrics.getInstance().comparison_tiers.inc(tier=tier)
+            total = sum(self._counts.values())
+            if total % self.log_every != 0:
+                return
+            rates = ', '.join(f"{name}={count / total:.1%}" for name, count in self._counts.items())
+        Logger.getInstance().log(f"Comparison tier hit rates over {total} checks: {rates}")
 
-        img1_array = (img1_array - np.min(img1_array)) / (np.max(img1_array) - np.min(img1_array))
-        img2_array = (img2_array - np.min(img2_array)) / (np.max(img2_array) - np.min(img2_array))
 
-        ssim_score = ssim(img1_array, img2_array, data_range=1.0)
+comparison_stats = ComparisonStats()
 
-        diff = cv2.absdiff(img1_gray, img2_gray)
-        Logger.getInstance().log(f"SSIM Score: {ssim_score}")
 
-        img1_pil = Image.fromarray(cv2.cvtColor(img1, cv2.COLOR_BGR2RGB))
-        img2_pil = Image.fromarray(cv2.cvtColor(img2, cv2.COLOR_BGR2RGB))
-        diff_pil = Image.fromarray(diff)
+def detect_changes(url, last_change=None, page_load_timeout=None, selector=None):
+    current_snapshot = take_screenshot(url, selector, page_load_timeout)
+    if current_snapshot is None:
+        return False, None, None, None
+    change_detected, diff_images, capture = evaluate_capture(current_snapshot, last_change)
+    return change_detected, current_snapshot, diff_images, capture
 
-        change_detected = ssim_score < 0.85
 
-        return change_detected, {
-            'before': img1_pil,
-            'after': img2_pil,
-            'diff': diff_pil,
-            'ssim': ssim_score,
-        }
-    except Exception as e:
-        # Log the error and its traceback
-        error_message = f"Error comparing images: {e}"
-        print(error_message)
-        traceback_message = traceback.format_exc()
-        print(traceback_message)
-        Logger.getInstance().log(error_message)
-        Logger.getInstance().log(traceback_message)
-        return False, None
-def detect_changes(url, last_snapshot=None):
-    current_snapshot, current_snapshot_path = take_screenshot(url)
-
-    if last_snapshot and current_snapshot:
-        last_snapshot_path = save_image_to_disk(last_snapshot, 'last_screenshot.png')
-        change_detected, diff_images = compare_images(current_snapshot_path, last_snapshot_path)
-        return change_detected, current_snapshot, diff_images
-    elif current_snapshot:
-        return True, current_snapshot, None
+def evaluate_capture(current_snapshot, last_change=None):
+    capture = {'content_hash': content_hash(current_snapshot)}
+    if last_change is not None:
+        if last_change.content_hash is None:
+            last_change.content_hash = content_hash(load_screenshot(last_change))
+        if last_change.content_hash == capture['content_hash']:
+            comparison_stats.record('exact')
+            return False, None, capture
+
+    try:
+        current_image = decode_image(current_snapshot)
+    except ValueError as e:
+        Logger.getInstance().log(f"Error decoding screenshot: {e}", level='error')
+        return False, None, capture
+    capture['image'] = current_image
+    capture['perceptual_hash'] = dhash(current_image)
+
+    if last_change is None:
+        return True, None, capture
+
+    # Il dHash a 64 bit serve solo a dire "certamente cambiato": una distanza piccola
+    # non esclude modifiche locali (un prezzo, un blocco dell'1%), che decide il motore a tile
+    if last_change.perceptual_hash is not None:
+        distance = hamming_distance(last_change.perceptual_hash, capture['perceptual_hash'])
+        if distance >= current_app.config.get('PHASH_CHANGED_DISTANCE', 12):
+            comparison_stats.record('phash_changed')
+            return True, None, capture
+
+    # Hash vicini (o mancanti): serve il confronto completo
+    references = ReferenceCache.getInstance()
+    last_image = references.get(last_change.monitored_area_id, last_change.id)
+    if last_image is None:
+        try:
+            last_image = to_gray(decode_image(load_screenshot(last_change)))
+        except (ValueError, OSError, TypeError) as e:
+            Logger.getInstance().log(f"Error decoding previous screenshot: {e}", level='error',
+                                     change_id=last_change.id)
+            return False, None, capture
+        references.put(last_change.monitored_area_id, last_change.id, last_image)
+    if last_change.perceptual_hash is None:
+        last_change.perceptual_hash = dhash(last_image)
+    comparison_stats.record('ssim')
+    with Metrics.getInstance().stage('compare'):
+        change_detected, diff_images = compare_images(last_image, current_image)
+    return change_detected, diff_images, capture
+
+
+def record_visual_check(ma, current_snapshot, now):
+    # Le modifiche salvate in modalità testo possono non avere uno screenshot
+    last_changed = Change.query.options(defer(Change.screenshot)).filter(
+        Change.monitored_area_id == ma.id,
+        or_(Change.screenshot_key.isnot(None), Change.screenshot.isnot(None))).order_by(
+        Change.change_detected_at.desc()).first()
+
+    change_detected, diff_images, capture = evaluate_capture(current_snapshot, last_changed)
+    Logger.getInstance().log(f"Screenshot taken, change detected: {change_detected}", area_id=ma.id)
+    if change_detected or not last_changed:
+        change_summary = "First screenshot" if not last_changed else "Change detected"
+        screenshot_key = BlobStore.getInstance().put(current_snapshot)
+        if capture.get('image') is not None:
+            store_thumbnails(screenshot_key, capture['image'])
+        new_change = Change(monitored_area_id=ma.id, change_snapshot="",
+                            change_summary=change_summary,
+                            screenshot_key=screenshot_key,
+                            content_hash=capture['content_hash'],
+                            perceptual_hash=capture.get('perceptual_hash'),
+                            changed_regions=json.dumps(diff_images['regions']) if diff_images else None)
+        db.session.add(new_change)
+        try:
+            with Metrics.getInstance().stage('db_commit'):
+                db.session.commit()
+            Logger.getInstance().log(f"New change detected for {ma.website.url}", area_id=ma.id,
+                                 url=ma.website.url, change_id=new_change.id)
+            if capture.get('image') is not None:
+                # La nuova cattura è il prossimo riferimento: già decodificata, non servirà rifarlo
+                ReferenceCache.getInstance().put(ma.id, new_change.id, to_gray(capture['image']))
+        except Exception as e:
+            db.session.rollback()
+            Logger.getInstance().log(f"Error adding new change: {e}", level='error', area_id=ma.id)
+
+    ma.last_change_checked = now
+    return change_detected
+
+
+def record_text_check(ma, captured, now):
+    # Modalità testo/HTML: confronto per hash e diff per righe, senza decodificare immagini
+    last_changed = Change.query.options(defer(Change.screenshot)).filter_by(monitored_area_id=ma.id).order_by(
+        Change.change_detected_at.desc()).first()
+
+    current_text = captured['text']
+    change_detected = last_changed is None or \
+        content_hash(last_changed.change_snapshot.encode('utf-8')) != content_hash(current_text.encode('utf-8'))
+    if last_changed is not None:
+        comparison_stats.record('text')
+    Logger.getInstance().log(f"Text captured, change detected: {change_detected}", area_id=ma.id)
+    if not change_detected:
+        ma.last_change_checked = now
+        return False
+
+    if last_changed is None:
+        change_summary = "First snapshot"
     else:
-        return False, None, None
+        diff = difflib.unified_diff(last_changed.change_snapshot.splitlines(), current_text.splitlines(),
+                                    lineterm='', n=0)
+        change_summary = '\n'.join(['Change detected'] + list(diff)[2:])
+
+    screenshot = captured.get('screenshot')
+    screenshot_key = None
+    if screenshot:
+        screenshot_key = BlobStore.getInstance().put(screenshot)
+        try:
+            store_thumbnails(screenshot_key, decode_image(screenshot))
+        except ValueError as e:
+            Logger.getInstance().log(f"Error creating thumbnails: {e}", level='error', area_id=ma.id)
+    new_change = Change(monitored_area_id=ma.id, change_snapshot=current_text,
+                        change_summary=change_summary,
+                        screenshot_key=screenshot_key,
+                        content_hash=content_hash(screenshot) if screenshot else None)
+    db.session.add(new_change)
+    try:
+        with Metrics.getInstance().stage('db_commit'):
+            db.session.commit()
+        Logger.getInstance().log(f"New change detected for {ma.website.url}", area_id=ma.id,
+                                 url=ma.website.url, change_id=new_change.id)
+    except Exception as e:
+        db.session.rollback()
+        Logger.getInstance().log(f"Error adding new change: {e}", level='error', area_id=ma.id)
 
+    ma.last_change_checked = now
+    return True
 
-def async_monitor(app):
-    with app.app_context():
-        while True:
-            now = datetime.now()
-            monitored_areas = MonitoredArea.query.all()
-            for ma in monitored_areas:
-                if ma.last_change_checked is None:
-                    last_check = datetime.min
-                else:
-                    last_check = ma.last_change_checked
-
-                if now - last_check >= timedelta(minutes=ma.time_interval):
-                    Logger.getInstance().log(f"Checking {ma.website.url}")
-
-                    last_changed = Change.query.filter_by(monitored_area_id=ma.id).order_by(
-                        Change.change_detected_at.desc()).first()
-
-                    change_detected, current_snapshot, diff_images = detect_changes(ma.website.url,
-                                                                                    last_changed.screenshot if last_changed else None)
-                    Logger.getInstance().log(f"Change detected: {change_detected}")
-                    Logger.getInstance().log(f"Current snapshot exists: {'yes' if current_snapshot else 'no'}")
-
-                    if current_snapshot is not None:
-                        Logger.getInstance().log(f"Screenshot taken, change detected: {change_detected}")
-                        if change_detected or not last_changed:
-                            change_summary = "First screenshot" if not last_changed else "Change detected"
-                            new_change = Change(monitored_area_id=ma.id, change_snapshot="",
-                                                change_summary=change_summary,
-                                                screenshot=current_snapshot)
-                            db.session.add(new_change)
-                            try:
-                                db.session.commit()
-                                Logger.getInstance().log(f"New change detected for {ma.website.url}")
-
-                                #if change_detected and last_changed and diff_images:
-                                #    save_differences(last_changed.id, new_change.id, diff_images)
-
-                            except Exception as e:
-                                db.session.rollback()
-                                Logger.getInstance().log(f"Error adding new change: {e}")
 
-                        ma.last_change_checked = now
-                        try:
-                            db.session.commit()
-                        except Exception as e:
-                            db.session.rollback()
-                            Logger.getInstance().log(f"Error updating last check time: {e}")
-            time.sleep(10)
-
-
-def save_differences(change_id1, change_id2, diff_images):
-    for image_type, image_data in diff_images.items():
-        if image_type in ['before', 'after', 'diff']:
-
-            new_diff = Difference(
-                change_id1=change_id1,
-                change_id2=change_id2,
-                diff_image=image_data,
-                created_at=datetime.utcnow()
-            )
-            db.session.add(new_diff)
-        elif image_type in ['ssim', 'percent_diff']:
-
-            change1 = Change.query.get(change_id1)
-            if change1:
-                summary = change1.change_summary or {}
-                summary[image_type] = image_data
-                change1.change_summary = str(summary)
-            change2 = Change.query.get(change_id2)
-            if change2:
-                summary = change2.change_summary or {}
-                summary[image_type] = image_data
-                change2.change_summary = str(summary)
-        else:
-            Logger.getInstance().log(f"Unknown diff type: {image_type}")
-            continue
+def apply_precheck_state(ma, precheck_state):
+    # Senza un pre-controllo valido i validatori vengono azzerati, per non saltare
+    # in seguito un render sulla base di dati vecchi
+    state = precheck_state.get(ma.id, {})
+    ma.http_etag = state.get('http_etag')
+    ma.http_last_modified = state.get('http_last_modified')
+    ma.html_hash = state.get('html_hash')
+
 
+def check_website(app, website_id, area_ids, worker_id, timeout=None):
+    # Ogni worker ha il proprio app context, quindi la propria db.session
+    with app.app_context():
+        areas = MonitoredArea.query.options(joinedload(MonitoredArea.website)).filter(
+            MonitoredArea.id.in_(area_ids), MonitoredArea.website_id == website_id).all()
+        if not areas:
+            return
+
+        now = datetime.now()
+        metrics = Metrics.getInstance()
+        for ma in areas:
+            if ma.next_check_at is not None:
+                # Le aree anticipate dalla finestra di coalescenza non sono in ritardo
+                metrics.scheduler_lag_seconds.observe(max(0.0, (now - ma.next_check_at).total_seconds()))
+        # Se il controllo fallisce l'area viene comunque riprogrammata, più avanti
+        retry_at = now + timedelta(seconds=app.config.get('MONITOR_RETRY_DELAY', 60))
+        next_checks = {ma.id: retry_at for ma in areas}
+        website = areas[0].website
+        url = website.url
+        with metrics.trace(app.config.get('MONITOR_SLOW_CHECK_SECONDS'), website_id=website_id, url=url):
+            try:
+                to_render, precheck_state = areas, {}
+                if website.precheck_enabled:
+                    with metrics.stage('precheck'):
+                        skipped, to_render, precheck_state = HttpPrecheck.getInstance().check(url, areas)
+                    for ma in skipped:
+                        if ma.id in precheck_state:
+                            apply_precheck_state(ma, precheck_state)
+                        ma.last_change_checked = now
+                        next_checks[ma.id] = now + timedelta(minutes=update_interval(ma, False, now))
+                        metrics.area_checks.inc(result='skipped')
+                    if skipped:
+                        Logger.getInstance().log(f"Pre-check: {len(skipped)} areas of {url} unchanged, "
+                                                 f"render skipped", url=url, website_id=website_id)
+                    if not to_render:
+                        return
+
+                Logger.getInstance().log(f"Checking {url} for {len(to_render)} areas", url=url,
+                                         website_id=website_id, area_ids=[ma.id for ma in to_render])
+                captures = capture_page(url, {(ma.area_selector, ma.compare_mode) for ma in to_render}, timeout,
+                                        website.readiness_timeout)
+
+                for ma in to_render:
+                    captured = captures.get((ma.area_selector, ma.compare_mode))
+                    Logger.getInstance().log(f"Current snapshot exists: {'yes' if captured else 'no'}",
+                                             level='debug', area_id=ma.id)
+                    if captured is None:
+                        metrics.area_checks.inc(result='failed')
+                        continue
+                    try:
+                        if ma.compare_mode in TEXT_COMPARE_MODES:
+                            changed = record_text_check(ma, captured, now)
+                        else:
+                            changed = record_visual_check(ma, captured['screenshot'], now)
+                        apply_precheck_state(ma, precheck_state)
+                        next_checks[ma.id] = now + timedelta(minutes=update_interval(ma, changed, now))
+                        metrics.area_checks.inc(result='changed' if changed else 'unchanged')
+                    except Exception as e:
+                        db.session.rollback()
+                        metrics.area_checks.inc(result='failed')
+                        Logger.getInstance().log(f"Error checking area {ma.id}: {e}", level='error', area_id=ma.id,
+                                                 url=url, traceback=traceback.format_exc())
+            finally:
+                try:
+                    with metrics.stage('db_commit'):
+                        db.session.commit()
+                        # Lease e prossimo controllo solo se il lease è ancora nostro: un controllo
+                        # oltre il timeout può averlo perso a favore di un altro worker o della compattazione
+                        for ma in areas:
+                            release_leases(worker_id, [ma.id], next_checks[ma.id])
+                except Exception as e:
+                    db.session.rollback()
+                    Logger.getInstance().log(f"Error updating last check time: {e}", level='error',
+                                             website_id=website_id)
+
+
+def new_worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+
+def heartbeat(app, worker_id, lease_seconds, interval, executor):
+    # Un worker morto smette di rinnovare: i suoi lease scadono e le aree
+    # tornano disponibili agli altri worker
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                renew_leases(worker_id, datetime.now(), lease_seconds, executor.active_keys())
+            except Exception as e:
+                db.session.rollback()
+                Logger.getInstance().log(f"Lease heartbeat failed: {e}", level='error', worker_id=worker_id)
+            finally:
+                db.session.remove()
+
+
+def report_renders_saved(worker_id):
     try:
-        db.session.commit()
-        Logger.getInstance().log(f"Successfully saved differences for changes {change_id1} and {change_id2}")
+        saved = renders_saved_per_hour()
     except Exception as e:
         db.session.rollback()
-        Logger.getInstance().log(f"Error adding new differences: {e}")
\ No newline at end of file
+        Logger.getInstance().log(f"Error computing renders saved: {e}", level='error', worker_id=worker_id)
+        return
+    Metrics.getInstance().renders_saved.set(saved)
+    Logger.getInstance().log(f"Adaptive intervals save {saved:.1f} renders per hour", worker_id=worker_id,
+                             renders_saved_per_hour=round(saved, 2))
+
+
+def run_worker(app, worker_id=None):
+    config = app.config
+    worker_id = worker_id or new_worker_id()
+    executor = CheckExecutor(max_workers=config.get('MONITOR_MAX_WORKERS', 4),
+                             per_host_limit=config.get('MONITOR_PER_HOST_LIMIT', 1),
+                             check_timeout=config.get('MONITOR_CHECK_TIMEOUT', 60))
+    coalesce_window = timedelta(seconds=config.get('MONITOR_COALESCE_WINDOW', 15))
+    lease_seconds = config.get('MONITOR_LEASE_SECONDS', 120)
+    claim_batch = config.get('MONITOR_CLAIM_BATCH', 10)
+    poll_interval = config.get('MONITOR_POLL_INTERVAL', 5)
+    report_interval = config.get('ADAPTIVE_REPORT_INTERVAL', 300)
+    next_report = time.monotonic()
+    metrics = Metrics.getInstance()
+
+    heartbeat_thread = Thread(target=heartbeat, args=(app, worker_id, lease_seconds,
+                                                      config.get('MONITOR_HEARTBEAT_INTERVAL', 30), executor))
+    heartbeat_thread.daemon = True
+    heartbeat_thread.start()
+    Logger.getInstance().log(f"Monitor worker {worker_id} started", worker_id=worker_id)
+
+    with app.app_context():
+        while True:
+            if time.monotonic() >= next_report:
+                report_renders_saved(worker_id)
+                db.session.remove()
+                next_report = time.monotonic() + report_interval
+            metrics.checks_in_flight.set(executor.in_flight())
+            executor.report_overdue()
+            free_slots = executor.free_slots()
+            if free_slots <= 0:
+                time.sleep(0.5)
+                continue
+
+            now = datetime.now()
+            try:
+                # Si dorme fino alla prossima scadenza, al massimo poll_interval: le aree
+                # nuove o modificate dall'API e i lease scaduti vengono visti comunque
+                next_due = next_due_at(now)
+                if next_due is None or next_due > now:
+                    delay = poll_interval if next_due is None else \
+                        min(poll_interval, (next_due - now).total_seconds())
+                    db.session.remove()
+                    time.sleep(delay)
+                    continue
+
+                metrics.queue_depth.set(count_due_areas(now))
+                # Anticipa le aree in scadenza a breve, così finiscono nello stesso caricamento
+                # delle altre aree dello stesso sito
+                claimed = claim_due_areas(worker_id, now, now + coalesce_window, free_slots * claim_batch,
+                                          lease_seconds)
+                if not claimed:
+                    db.session.remove()
+                    time.sleep(poll_interval)
+                    continue
+
+                monitored_areas = MonitoredArea.query.options(joinedload(MonitoredArea.website)).filter(
+                    MonitoredArea.id.in_(claimed)).all()
+                by_website = {}
+                for ma in monitored_areas:
+                    by_website.setdefault(ma.website_id, []).append(ma)
+
+                rejected = []
+                for website_id, areas in by_website.items():
+                    url = areas[0].website.url
+                    area_ids = [ma.id for ma in areas]
+                    if not executor.submit(website_id, urlparse(url).hostname, check_website,
+                                           app, website_id, area_ids, worker_id, executor.check_timeout):
+                        rejected.extend(area_ids)
+                if rejected:
+                    # Nessun worker libero o limite per host raggiunto: le aree tornano
+                    # disponibili a tutti fra qualche secondo
+                    release_leases(worker_id, rejected, now + timedelta(seconds=5))
+            except Exception as e:
+                db.session.rollback()
+                Logger.getInstance().log(f"Monitor loop error: {e}", level='error', worker_id=worker_id,
+                                         traceback=traceback.format_exc())
+                time.sleep(poll_interval)
+            finally:
+                db.session.remove()
@@ -0,0 +1,111 @@
+import threading
+import requests
+from bs4 import BeautifulSoup
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from .hashing import content_hash
+from .logger import Logger
+
+FULL_PAGE_SELECTORS = ('', 'html', 'body')
+
+
+def strip_noise(soup):
+    for tag in soup(['script', 'style', 'noscript']):
+        tag.decompose()
+    return soup
+
+
+def sanitize_html(html):
+    # HTML senza script/stili, un tag per riga: il diff per righe resta leggibile
+    soup = strip_noise(BeautifulSoup(html, 'html.parser'))
+    return soup.prettify()
+
+
+def html_hash(html, selector=None):
+    # Hash dell'HTML normalizzato (solo la regione del selettore, se indicato).
+    # None se il selettore non è nell'HTML statico, ad esempio perché lo genera JavaScript.
+    soup = strip_noise(BeautifulSoup(html, 'html.parser'))
+    node = soup
+    if selector is not None and selector.strip().lower() not in FULL_PAGE_SELECTORS:
+        try:
+            node = soup.select_one(selector)
+        except Exception:
+            return None
+        if node is None:
+            return None
+    return content_hash(' '.join(str(node).split()).encode('utf-8'))
+
+
+# Richiesta HTTP leggera, con connessioni riutilizzate, che permette di saltare il
+# render in Chrome quando la pagina non è cambiata dall'ultimo controllo.
+class HttpPrecheck:
+    _instance = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def getInstance():
+        with HttpPrecheck._lock:
+            if HttpPrecheck._instance is None:
+                config = current_app.config
+                HttpPrecheck(pool_size=config.get('MONITOR_MAX_WORKERS', 4),
+                             timeout=config.get('PRECHECK_TIMEOUT', 10))
+            return HttpPrecheck._instance
+
+    def __init__(self, pool_size=4, timeout=10):
+        if HttpPrecheck._instance is not None:
+            raise Exception("This class is a singleton!")
+        HttpPrecheck._instance = self
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = ('Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+                                              '(KHTML, like Gecko) Chrome/126.0 Safari/537.36')
+
+    def fetch(self, url, etag=None, last_modified=None):
+        # Ritorna (non modificata, risposta) oppure None se la richiesta fallisce
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            Logger.getInstance().log(f"Pre-check failed for {url}: {e}", level='warning', url=url)
+            return None
+        if response.status_code == 304:
+            return True, response
+        if response.status_code != 200:
+            return None
+        return False, response
+
+    def check(self, url, areas):
+        # Divide le aree in (da saltare, da renderizzare, validatori per area).
+        # Un'area si salta solo se è già stata renderizzata con gli stessi validatori
+        # o con lo stesso hash HTML della sua regione.
+        validators = {(ma.http_etag, ma.http_last_modified) for ma in areas}
+        etag, last_modified = validators.pop() if len(validators) == 1 else (None, None)
+        result = self.fetch(url, etag, last_modified)
+        if result is None:
+            return [], list(areas), {}
+        not_modified, response = result
+
+        skip, render, state = [], [], {}
+        for ma in areas:
+            if not not_modified:
+                state[ma.id] = {
+                    'http_etag': response.headers.get('ETag'),
+                    'http_last_modified': response.headers.get('Last-Modified'),
+                    'html_hash': html_hash(response.text, ma.area_selector),
+                }
+            if ma.last_change_checked is None:
+                render.append(ma)
+            elif not_modified:
+                skip.append(ma)
+            elif state[ma.id]['html_hash'] is not None and state[ma.id]['html_hash'] == ma.html_hash:
+                skip.append(ma)
+            else:
+                render.append(ma)
+        return skip, render, state
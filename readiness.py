@@ -0,0 +1,51 @@
+import time
+from selenium.common.exceptions import WebDriverException
+
+# Stato della pagina in un solo round-trip: readyState, font, numero di risorse
+# caricate (per capire quando la rete è ferma) e posizione degli elementi attesi.
+READINESS_SCRIPT = """
+const selectors = arguments[0];
+const rects = selectors.map(function (selector) {
+    let element = null;
+    try { element = document.querySelector(selector); } catch (e) { return null; }
+    if (!element) { return null; }
+    const rect = element.getBoundingClientRect();
+    return [rect.x, rect.y, rect.width, rect.height];
+});
+return {
+    ready: document.readyState === 'complete' && (!document.fonts || document.fonts.status === 'loaded'),
+    resources: performance.getEntriesByType('resource').length,
+    rects: rects
+};
+"""
+
+
+# Attende che la pagina sia pronta: documento caricato, nessuna nuova risorsa per
+# idle_time secondi e selettori presenti con posizione e dimensioni stabili.
+# Ritorna (secondi attesi, pronta) senza mai superare timeout.
+def wait_until_ready(driver, selectors=(), timeout=10, idle_time=0.5, poll_interval=0.1):
+    selectors = [selector for selector in selectors if selector]
+    start = time.monotonic()
+    last_state = None
+    stable_since = None
+    while True:
+        now = time.monotonic()
+        try:
+            state = driver.execute_script(READINESS_SCRIPT, selectors)
+        except WebDriverException:
+            state = None
+
+        if state and state['ready'] and all(rect is not None for rect in state['rects']):
+            fingerprint = (state['resources'], [tuple(rect) for rect in state['rects']])
+            if fingerprint != last_state:
+                last_state = fingerprint
+                stable_since = now
+            elif now - stable_since >= idle_time:
+                return now - start, True
+        else:
+            last_state = None
+            stable_since = None
+
+        if now - start >= timeout:
+            return now - start, False
+        time.sleep(poll_interval)
@@ -0,0 +1,83 @@
+import glob
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+from flask import current_app
+
+
+# Frame di riferimento di ogni area (lo screenshot dell'ultima modifica) già
+# decodificato e in scala di grigi, pronto per compare_frames. In memoria c'è
+# un LRU limitato in byte; su disco un file .npy per area, riaperto in mmap dopo
+# un riavvio o uno sfratto, così un controllo decodifica solo la nuova cattura.
+class ReferenceCache:
+    _instance = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def getInstance():
+        with ReferenceCache._lock:
+            if ReferenceCache._instance is None:
+                config = current_app.config
+                ReferenceCache(config.get('REFERENCE_CACHE_DIR', 'reference_cache'),
+                               config.get('REFERENCE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+            return ReferenceCache._instance
+
+    def __init__(self, root, max_bytes=256 * 1024 * 1024):
+        if ReferenceCache._instance is not None:
+            raise Exception("This class is a singleton!")
+        ReferenceCache._instance = self
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._entries_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, area_id, change_id):
+        return os.path.join(self.root, f'{area_id}-{change_id}.npy')
+
+    def _remember(self, area_id, change_id, frame):
+        with self._entries_lock:
+            previous = self._entries.pop(area_id, None)
+            if previous is not None:
+                self._size -= previous[1].nbytes
+            self._entries[area_id] = (change_id, frame)
+            self._size += frame.nbytes
+            while len(self._entries) > 1 and self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= evicted.nbytes
+
+    def get(self, area_id, change_id):
+        with self._entries_lock:
+            entry = self._entries.get(area_id)
+            if entry is not None and entry[0] == change_id:
+                self._entries.move_to_end(area_id)
+                return entry[1]
+        try:
+            frame = np.load(self.path(area_id, change_id), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+        self._remember(area_id, change_id, frame)
+        return frame
+
+    def put(self, area_id, change_id, frame):
+        frame = np.ascontiguousarray(frame)
+        self._remember(area_id, change_id, frame)
+        path = self.path(area_id, change_id)
+        # Scrittura atomica: più worker sulla stessa macchina condividono la directory
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                np.save(tmp_file, frame)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+        for stale in glob.glob(os.path.join(self.root, f'{area_id}-*.npy')):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,65 @@
+import importlib
+import os
+import sys
+import tempfile
+import pytest
+
+# La radice del repository è il pacchetto (import relativi) e contiene config.py,
+# importato come modulo di primo livello da create_app
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(REPO_DIR)
+sys.path[:0] = [os.path.dirname(REPO_DIR), REPO_DIR]
+os.environ.setdefault('LOG_DIR', tempfile.mkdtemp(prefix='webmonitor-test-log-'))
+
+
+def module(name):
+    return importlib.import_module(f'{PACKAGE}.{name}')
+
+
+@pytest.fixture
+def app(tmp_path):
+    blobstore = module('blobstore')
+    reference_cache = module('reference_cache')
+    # I singleton tengono la configurazione dell'app che li ha creati
+    blobstore.BlobStore._instance = None
+    reference_cache.ReferenceCache._instance = None
+    app = importlib.import_module(PACKAGE).create_app(config={
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+        'BLOB_STORE_ROOT': str(tmp_path / 'blobs'),
+        'REFERENCE_CACHE_DIR': str(tmp_path / 'references'),
+    })
+    with app.app_context():
+        yield app
+        module('models').db.session.remove()
+    blobstore.BlobStore._instance = None
+    reference_cache.ReferenceCache._instance = None
+
+
+@pytest.fixture
+def user(app):
+    models = module('models')
+    user = models.User(username='tester', password='x', email='tester@example.com')
+    models.db.session.add(user)
+    models.db.session.commit()
+    return user
+
+
+@pytest.fixture
+def make_area(app, user):
+    models = module('models')
+    counter = iter(range(1, 1000))
+
+    def make_area(website=None, **fields):
+        n = next(counter)
+        if website is None:
+            website = models.Website(url=f'https://site{n}.example.com')
+            models.db.session.add(website)
+            models.db.session.commit()
+        ma = models.MonitoredArea(user_id=user.id, website_id=website.id, name=f'area {n}',
+                                  area_selector='body', **fields)
+        models.db.session.add(ma)
+        models.db.session.commit()
+        return ma
+
+    return make_area
@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+import pytest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import text
+from conftest import module
+
+migrations = module('migrations')
+models = module('models')
+views = module('views')
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def client(app, user):
+    token = create_access_token(identity=views.JWTIdentity(user))
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
+
+
+def add_changes(ma, times):
+    changes = [models.Change(monitored_area_id=ma.id, change_snapshot='', change_detected_at=detected_at)
+               for detected_at in times]
+    models.db.session.add_all(changes)
+    models.db.session.commit()
+    return [change.id for change in changes]
+
+
+def read_all(client, limit):
+    ids, cursor = [], None
+    # Limite di sicurezza: un cursore che non avanza farebbe girare il ciclo per sempre
+    for _ in range(100):
+        url = f'/changes?limit={limit}' + (f'&cursor={cursor}' if cursor else '')
+        response = client.get(url)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['changes']) <= limit
+        ids += [change['id'] for change in page['changes']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            return ids
+    pytest.fail('Pagination did not terminate')
+
+
+def test_pages_cover_changes_with_equal_timestamps(client, make_area):
+    ma = make_area()
+    # Più cambiamenti nello stesso istante: solo l'id li distingue nel cursore
+    ids = add_changes(ma, [START] * 5 + [START + timedelta(minutes=1)] * 3 + [START - timedelta(days=1)])
+
+    for limit in (1, 2, 4, 9, 50):
+        pages = read_all(client, limit)
+        assert sorted(pages) == sorted(ids)
+        assert len(pages) == len(set(pages))
+
+
+def test_pages_cover_legacy_timestamps(app, client, make_area):
+    ma = make_area()
+    new_ids = add_changes(ma, [START, START + timedelta(seconds=1)])
+    # Righe scritte dal vecchio default CURRENT_TIMESTAMP, senza microsecondi: prima
+    # della normalizzazione il confronto testuale con il cursore non avanzava mai
+    with models.db.engine.begin() as connection:
+        for _ in range(3):
+            connection.execute(text("INSERT INTO change (monitored_area_id, change_snapshot, change_detected_at) "
+                                    "VALUES (:area_id, '', '2026-01-01 12:00:00')"), {'area_id': ma.id})
+    legacy_ids = [row.id for row in models.db.session.query(models.Change.id).filter(
+        models.Change.id.notin_(new_ids))]
+
+    migrations.upgrade()
+
+    for limit in (1, 2, 3):
+        pages = read_all(client, limit)
+        assert sorted(pages) == sorted(new_ids + legacy_ids)
+        assert len(pages) == len(set(pages))
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get('/changes?cursor=not-a-cursor').status_code == 400
+    assert client.get('/changes?limit=0').status_code == 400
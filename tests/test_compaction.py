@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from conftest import module
+
+compaction = module('compaction')
+blobstore = module('blobstore')
+deltas = module('deltas')
+models = module('models')
+
+START = datetime(2026, 1, 1)
+
+
+def frame(seed):
+    # Pagina con rumore: i frame successivi cambiano solo in un riquadro
+    image = np.random.default_rng(0).integers(0, 256, (60, 80, 3), dtype=np.uint8)
+    image[10:20, 10 + seed:30 + seed] = seed * 37 % 256
+    return image
+
+
+def add_change(ma, image, detected_at):
+    change = models.Change(monitored_area_id=ma.id, change_snapshot='', change_detected_at=detected_at,
+                           screenshot_key=blobstore.BlobStore.getInstance().put(deltas.encode_png(image)))
+    models.db.session.add(change)
+    models.db.session.commit()
+    return change
+
+
+def policy(full_frames, keyframe_interval, downsample_hours):
+    return {'retention_full_frames': full_frames, 'retention_keyframe_interval': keyframe_interval,
+            'retention_downsample_hours': downsample_hours}
+
+
+def pixels(change):
+    return deltas.decode_png(blobstore.load_screenshot(change))
+
+
+@pytest.fixture
+def history(make_area):
+    ma = make_area()
+    # Due frame nello stesso giorno, poi uno al giorno
+    times = [START, START + timedelta(hours=1)] + [START + timedelta(days=day) for day in range(1, 5)]
+    images = [frame(index) for index in range(len(times))]
+    changes = [add_change(ma, image, detected_at) for image, detected_at in zip(images, times)]
+    return ma, changes, images
+
+
+def test_deltas_rebuild_exact_pixels(history):
+    ma, changes, images = history
+    reaper = compaction.BlobReaper(grace_seconds=0)
+
+    stats = compaction.compact_area(ma, policy(2, 10, 0), reaper)
+    reaper.collect(force=True)
+
+    assert stats == {'kept_full': 2, 'keyframes': 1, 'deltas': 3, 'pruned': 0}
+    assert changes[0].delta_key is None
+    assert all(change.delta_base_id == changes[0].id for change in changes[1:4])
+    for change, image in zip(changes, images):
+        assert np.array_equal(pixels(change), image)
+
+
+def test_pruned_keyframe_keeps_its_deltas_readable(history):
+    ma, changes, images = history
+    reaper = compaction.BlobReaper(grace_seconds=0)
+    compaction.compact_area(ma, policy(2, 10, 0), reaper)
+
+    # Con il downsample giornaliero il keyframe (il più vecchio del primo giorno) viene
+    # eliminato, mentre i frame codificati rispetto a lui restano
+    stats = compaction.compact_area(ma, policy(2, 10, 24), reaper)
+    reaper.collect(force=True)
+
+    assert stats['pruned'] == 1
+    assert changes[0].screenshot_key is None
+    for change, image in zip(changes[1:], images[1:]):
+        assert change.delta_base_id != changes[0].id
+        assert np.array_equal(pixels(change), image)
+
+
+def test_reaper_keeps_blob_shared_with_another_row(make_area):
+    image = frame(1)
+    pruned_area, other_area = make_area(), make_area()
+    shared = add_change(other_area, image, START)
+    # Il frame condiviso è il più vecchio del suo giorno, quindi il downsample lo elimina
+    add_change(pruned_area, image, START)
+    for index, detected_at in enumerate([timedelta(hours=1), timedelta(days=1), timedelta(days=2)]):
+        add_change(pruned_area, frame(index + 2), START + detected_at)
+    reaper = compaction.BlobReaper(grace_seconds=0)
+
+    stats = compaction.compact_area(pruned_area, policy(2, 1, 24), reaper)
+    deleted = reaper.collect(force=True)
+
+    assert stats['pruned'] == 1
+    assert deleted == 0
+    assert blobstore.BlobStore.getInstance().exists(shared.screenshot_key)
+    assert np.array_equal(pixels(shared), image)
+
+
+def test_reaper_deletes_unreferenced_blob(make_area):
+    ma = make_area()
+    times = [START, START + timedelta(hours=1), START + timedelta(days=1)]
+    changes = [add_change(ma, frame(index), detected_at) for index, detected_at in enumerate(times)]
+    pruned_key = changes[0].screenshot_key
+    reaper = compaction.BlobReaper(grace_seconds=0)
+
+    stats = compaction.compact_area(ma, policy(1, 1, 24), reaper)
+
+    assert stats['pruned'] == 1
+    assert reaper.collect(force=True) == 1
+    assert not blobstore.BlobStore.getInstance().exists(pruned_key)
@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+from conftest import module
+
+leases = module('leases')
+models = module('models')
+
+
+def lease_owners():
+    return {ma.id: ma.lease_owner for ma in models.MonitoredArea.query.order_by(models.MonitoredArea.id)}
+
+
+def test_competing_workers_claim_disjoint_areas(make_area):
+    areas = [make_area().id for _ in range(5)]
+    now = datetime.now()
+
+    first = leases.claim_due_areas('worker-a', now, now, 3, 60)
+    second = leases.claim_due_areas('worker-b', now, now, 10, 60)
+
+    assert len(first) == 3
+    assert not set(first) & set(second)
+    assert sorted(first + second) == areas
+    assert leases.claim_due_areas('worker-c', now, now, 10, 60) == []
+    owners = lease_owners()
+    assert all(owners[area_id] == 'worker-a' for area_id in first)
+    assert all(owners[area_id] == 'worker-b' for area_id in second)
+
+
+def test_expired_lease_is_reclaimed(make_area):
+    area_id = make_area().id
+    now = datetime.now()
+    assert leases.claim_due_areas('worker-a', now, now, 10, 60) == [area_id]
+
+    later = now + timedelta(seconds=30)
+    assert leases.claim_due_areas('worker-b', later, later, 10, 60) == []
+
+    expired = now + timedelta(seconds=61)
+    assert leases.claim_due_areas('worker-b', expired, expired, 10, 60) == [area_id]
+    assert lease_owners()[area_id] == 'worker-b'
+
+
+def test_release_only_by_current_owner(make_area):
+    area_id = make_area().id
+    now = datetime.now()
+    leases.claim_due_areas('worker-a', now, now, 10, 60)
+    expired = now + timedelta(seconds=61)
+    leases.claim_due_areas('worker-b', expired, expired, 10, 60)
+
+    # Il controllo di worker-a, oltre il timeout, termina dopo che worker-b ha preso l'area
+    leases.release_leases('worker-a', [area_id], now + timedelta(minutes=5))
+    ma = models.db.session.get(models.MonitoredArea, area_id)
+    models.db.session.refresh(ma)
+    assert ma.lease_owner == 'worker-b'
+    assert ma.next_check_at != now + timedelta(minutes=5)
+
+
+def test_heartbeat_renews_only_active_websites(make_area):
+    active, stuck = make_area(), make_area()
+    now = datetime.now()
+    leases.claim_due_areas('worker-a', now, now, 10, 60)
+
+    later = now + timedelta(seconds=30)
+    assert leases.renew_leases('worker-a', later, 60, [active.website_id]) == 1
+    models.db.session.expire_all()
+    assert active.lease_expires_at == later + timedelta(seconds=60)
+    assert stuck.lease_expires_at == now + timedelta(seconds=60)
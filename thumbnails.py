@@ -0,0 +1,40 @@
+from flask import current_app
+from .blobstore import BlobStore
+
+
+# Le miniature sono salvate accanto all'immagine originale, con una chiave
+# derivata da quella dell'originale e dalla larghezza.
+def thumbnail_key(key, width):
+    return f'{key}.w{width}'
+
+
+def thumbnail_widths():
+    return current_app.config.get('THUMBNAIL_WIDTHS', (160, 320, 640))
+
+
+# cv2 è importato solo qui: il processo API usa chiavi e larghezze senza caricarlo
+def make_thumbnail(image, width):
+    import cv2
+    height, original_width = image.shape[:2]
+    if original_width > width:
+        image = cv2.resize(image, (width, max(1, round(height * width / original_width))),
+                           interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 80])
+    if not ok:
+        raise ValueError("Thumbnail could not be encoded")
+    return encoded.tobytes()
+
+
+def decode_color(data):
+    import cv2
+    import numpy as np
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Image could not be decoded")
+    return image
+
+
+def store_thumbnails(key, image):
+    store = BlobStore.getInstance()
+    for width in thumbnail_widths():
+        store.put_as(thumbnail_key(key, width), make_thumbnail(image, width))
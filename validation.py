@@ -0,0 +1,129 @@
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from flask import current_app
+from .logger import Logger
+
+
+class TTLCache:
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return False, None
+            return True, value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            # Pulizia occasionale delle voci scadute
+            if len(self._entries) > 1000:
+                now = time.monotonic()
+                self._entries = {k: v for k, v in self._entries.items() if v[0] >= now}
+
+
+# La verifica non si è potuta fare (pool dei browser occupato): il job torna in coda
+class ValidationRetry(Exception):
+    pass
+
+
+dns_cache = TTLCache()
+http_cache = TTLCache()
+reachability_cache = TTLCache()
+
+
+def normalize_url(url):
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    return url
+
+
+def cache_ttl():
+    return current_app.config.get('VALIDATION_CACHE_TTL', 300)
+
+
+def resolve_host(hostname):
+    hit, resolved = dns_cache.get(hostname)
+    if hit:
+        return resolved
+    try:
+        socket.gethostbyname(hostname)
+        resolved = True
+    except (socket.gaierror, UnicodeError):
+        resolved = False
+    dns_cache.set(hostname, resolved, cache_ttl())
+    return resolved
+
+
+def is_cached(url):
+    url = normalize_url(url)
+    return dns_cache.get(urlparse(url).hostname)[0] and http_cache.get(url)[0]
+
+
+# Controllo leggero fatto dal processo API: il dominio esiste e il server risponde.
+# Qualsiasi risposta HTTP va bene (molti siti rispondono 403 ai client senza browser),
+# la verifica completa con il browser la fa il worker con check_reachable.
+def check_http_reachable(url):
+    url = normalize_url(url)
+    if not resolve_host(urlparse(url).hostname):
+        return 'Invalid domain'
+
+    hit, error = http_cache.get(url)
+    if hit:
+        return error
+
+    error = None
+    try:
+        response = requests.get(url, timeout=current_app.config.get('VALIDATION_HTTP_TIMEOUT', 5), stream=True)
+        response.close()
+    except requests.RequestException as e:
+        Logger.getInstance().log(f"URL not reachable over HTTP: {str(e)}", level='warning', url=url)
+        error = 'Website does not exist or is not accessible'
+    http_cache.set(url, error, cache_ttl())
+    return error
+
+
+# Ritorna il messaggio d'errore, oppure None se il sito è raggiungibile.
+# I risultati (anche negativi) restano in cache per VALIDATION_CACHE_TTL secondi.
+# Usa il browser: gira solo nel worker, che esegue i ValidationJob in coda.
+def check_reachable(url):
+    url = normalize_url(url)
+    if not resolve_host(urlparse(url).hostname):
+        return 'Invalid domain'
+
+    hit, error = reachability_cache.get(url)
+    if hit:
+        return error
+
+    from selenium.common.exceptions import WebDriverException, TimeoutException
+    from .browser_pool import BrowserPool, PoolExhausted
+    from .readiness import wait_until_ready
+
+    error = None
+    try:
+        with BrowserPool.getInstance().page(page_load_timeout=5, timeout=10) as driver:
+            driver.get(url)
+            # Basta che la pagina risponda: al massimo i 2 secondi dell'attesa fissa precedente
+            wait_until_ready(driver, timeout=min(current_app.config.get('READINESS_TIMEOUT', 10), 2))
+
+            # Verifica se la pagina è stata caricata correttamente
+            if "This site can't be reached" in driver.title or "Access Denied" in driver.page_source:
+                raise WebDriverException("Page couldn't be loaded")
+    except PoolExhausted as e:
+        # Non è un errore del sito: niente cache, il job verrà ripetuto
+        raise ValidationRetry(str(e))
+    except (WebDriverException, TimeoutException, TimeoutError) as e:
+        Logger.getInstance().log(f"URL access denied or timed out: {str(e)}", level='warning', url=url)
+        error = 'Website does not exist or is not accessible'
+    reachability_cache.set(url, error, cache_ttl())
+    return error
@@ -1,20 +1,28 @@
 import base64
-import socket
-from flask import request, jsonify, Blueprint
+import json
+from io import BytesIO
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, jsonify, Blueprint, send_file, url_for, current_app, Response, stream_with_context
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from sqlalchemy import func, or_, and_
 from sqlalchemy.exc import SQLAlchemyError
-from .models import db, User, Website, MonitoredArea, Change
+from .models import db, User, Website, MonitoredArea, Change, Difference, ValidationJob, COMPARE_MODES
 from werkzeug.security import generate_password_hash, check_password_hash
 import re
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import WebDriverException, TimeoutException
 from validators import url as validate_url
 from .models import Website, MonitoredArea
 from .logger import Logger
-import requests
-from urllib.parse import urlparse
-import time
+from .validation import check_reachable, check_http_reachable, is_cached, normalize_url, ValidationRetry
+from .metrics import Metrics
+from .blobstore import BlobStore, load_screenshot, load_diff_image
+from .thumbnails import thumbnail_key, thumbnail_widths
+from datetime import datetime
+
+# Il processo API non importa cv2, numpy, skimage né selenium all'avvio: i pochi
+# endpoint che lavorano sulle immagini (miniature mancanti, diff) li caricano
+# alla prima richiesta, il resto vive nel worker
 
 views = Blueprint('views', __name__)
 
@@ -67,96 +75,236 @@ def login_user():
     return jsonify({'message': 'Invalid credentials'}), 401
 
 def check_new_website(user_id, name, url):
+    # Ritorna il messaggio d'errore, oppure None se l'area può essere salvata
     if url:
-        # Normalizza l'URL
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-
         # Valida l'URL
-        if not validate_url(url):
-            return jsonify({'message': 'Invalid URL'}), 400
-
-        # Controlla se il dominio è valido
-        parsed_url = urlparse(url)
-        try:
-            socket.gethostbyname(parsed_url.netloc)
-        except socket.gaierror:
-            return jsonify({'message': 'Invalid domain'}), 400
+        if not validate_url(normalize_url(url)):
+            return 'Invalid URL'
 
         # Controlla se il sito è già monitorato dall'utente
-        existing_website = Website.query.filter_by(url=url).first()
+        existing_website = Website.query.filter_by(url=normalize_url(url)).first()
         if existing_website and MonitoredArea.query.filter_by(user_id=user_id, website_id=existing_website.id).first():
-            return jsonify({'message': 'You are already monitoring this website'}), 400
-
-        # Configura le opzioni di Chrome
-        options = webdriver.ChromeOptions()
-        options.add_argument('--headless')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--disable-gpu')
-        options.add_argument('--window-size=1920,1080')
-
-        try:
-            with webdriver.Chrome(options=options) as driver:
-                driver.set_page_load_timeout(5)
-                driver.get(url)
-                time.sleep(2)
-
-                # Verifica se la pagina è stata caricata correttamente
-                if "This site can't be reached" in driver.title or "Access Denied" in driver.page_source:
-                    raise WebDriverException("Page couldn't be loaded")
-
-                # Se arriviamo qui, il sito è accessibile
-        except (WebDriverException, TimeoutException) as e:
-            Logger.getInstance().log(f"URL access denied or timed out: {str(e)}")
-            return jsonify({'message': 'Website does not exist or is not accessible'}), 400
+            return 'You are already monitoring this website'
+
+        # Controlla che il dominio esista e che il sito sia raggiungibile (con cache)
+        error = check_reachable(url)
+        if error:
+            return error
 
     # Controlla se il nome è già utilizzato dall'utente
     if name and MonitoredArea.query.filter_by(user_id=user_id, name=name).first():
-        return jsonify({'message': 'You are already using this name for another monitored area'}), 400
+        return 'You are already using this name for another monitored area'
+
+    return None
+
+def check_interval_settings(data):
+    for key in ('min_interval', 'max_interval'):
+        value = data.get(key)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value <= 0):
+            return f'Invalid {key}'
+    if data.get('min_interval') and data.get('max_interval') and data['min_interval'] > data['max_interval']:
+        return 'min_interval cannot be greater than max_interval'
+    return None
+
+# Il timeout vale per il sito, condiviso tra gli utenti: limitato a READINESS_TIMEOUT_MAX
+def check_readiness_settings(data):
+    value = data.get('readiness_timeout')
+    maximum = current_app.config.get('READINESS_TIMEOUT_MAX', 60)
+    if value is not None and (not isinstance(value, int) or isinstance(value, bool) or not 0 < value <= maximum):
+        return f'readiness_timeout must be between 1 and {maximum} seconds'
+    return None
+
+RETENTION_MINIMUMS = {
+    'retention_full_frames': 2,  # le ultime due modifiche sono sempre mostrate per intero
+    'retention_keyframe_interval': 1,
+    'retention_downsample_hours': 0,
+}
+
+def check_retention_settings(data):
+    for key, minimum in RETENTION_MINIMUMS.items():
+        value = data.get(key)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < minimum):
+            return f'Invalid {key}'
+    return None
+
+def create_monitored_area(user_id, data):
+    url = data['url']
+    existing_website = Website.query.filter_by(url=url).first()
+    if not existing_website:
+        website = Website(url=url)
+        db.session.add(website)
+    else:
+        website = existing_website
+    if 'precheck' in data:
+        website.precheck_enabled = bool(data['precheck'])
+    if 'readiness_timeout' in data:
+        website.readiness_timeout = data['readiness_timeout']
+    db.session.commit()
+
+    # Crea l'area monitorata
+    new_monitored_area = MonitoredArea(
+        user_id=user_id,
+        website_id=website.id,
+        name=data.get('name'),
+        area_selector=data.get('selector'),
+        time_interval=data.get('time_interval', 60),
+        compare_mode=data.get('compare_mode', 'visual'),
+        adaptive_interval=bool(data.get('adaptive', False)),
+        min_interval=data.get('min_interval'),
+        max_interval=data.get('max_interval'),
+        retention_full_frames=data.get('retention_full_frames'),
+        retention_keyframe_interval=data.get('retention_keyframe_interval'),
+        retention_downsample_hours=data.get('retention_downsample_hours'),
+        next_check_at=datetime.now()
+    )
+    db.session.add(new_monitored_area)
+    db.session.commit()
+    return new_monitored_area
+
+def update_monitored_area(monitored_area, data):
+    name = data.get('name', '')
+    url = data.get('url', '')
+    if name != '':
+        monitored_area.name = name
+    if url != '':
+        monitored_area.website.url = url
+        monitored_area.next_check_at = datetime.now()
+    if 'precheck' in data:
+        monitored_area.website.precheck_enabled = bool(data['precheck'])
+    if 'readiness_timeout' in data:
+        monitored_area.website.readiness_timeout = data['readiness_timeout']
+    if data.get('compare_mode') is not None:
+        monitored_area.compare_mode = data['compare_mode']
+    if 'adaptive' in data:
+        monitored_area.adaptive_interval = bool(data['adaptive'])
+    for key in ('min_interval', 'max_interval', *RETENTION_MINIMUMS):
+        if key in data:
+            setattr(monitored_area, key, data[key])
+    if not monitored_area.adaptive_interval:
+        monitored_area.effective_interval = None
+
+    db.session.commit()
+
+# Eseguito dal worker (vedi worker.py), che ha il browser per check_reachable
+def run_validation_job(job_id):
+    job = db.session.get(ValidationJob, job_id)
+    job.status = 'running'
+    db.session.commit()
+
+    data = json.loads(job.payload)
+    try:
+        if job.action == 'create':
+            error = check_new_website(job.user_id, data.get('name'), data['url'])
+            if not error:
+                job.monitored_area_id = create_monitored_area(job.user_id, data).id
+                job.message = 'Website and monitored area added'
+        else:
+            monitored_area = MonitoredArea.query.filter_by(id=job.monitored_area_id, user_id=job.user_id).first()
+            error = 'Monitored area not found' if not monitored_area else \
+                check_new_website(job.user_id, data.get('name', ''), data.get('url', ''))
+            if not error:
+                update_monitored_area(monitored_area, data)
+                job.message = 'Monitored area updated successfully'
+        if error:
+            job.message = error
+        job.status = 'failed' if error else 'succeeded'
+    except ValidationRetry as e:
+        db.session.rollback()
+        Logger.getInstance().log(f"Validation job {job_id} requeued: {e}", level='warning', job_id=job_id)
+        job = db.session.get(ValidationJob, job_id)
+        job.status = 'queued'
+        job.started_at = None
+        db.session.commit()
+        return job
+    except Exception as e:
+        db.session.rollback()
+        Logger.getInstance().log(f"Validation job {job_id} failed: {e}", level='error', job_id=job_id)
+        job = db.session.get(ValidationJob, job_id)
+        job.status = 'failed'
+        job.message = f'An error occurred: {e}'
+    job.finished_at = datetime.utcnow()
+    db.session.commit()
+    return job
+
+# Parte del processo API: URL valido, DNS e risposta HTTP. Se passa, il job va in
+# coda ('queued') e un worker lo prende per la verifica con il browser.
+def precheck_validation_job(job_id):
+    job = db.session.get(ValidationJob, job_id)
+    url = json.loads(job.payload)['url']
+    try:
+        error = 'Invalid URL' if not validate_url(normalize_url(url)) else check_http_reachable(url)
+    except Exception as e:
+        Logger.getInstance().log(f"Validation job {job_id} failed: {e}", level='error', job_id=job_id)
+        error = f'An error occurred: {e}'
+    if error:
+        job.status = 'failed'
+        job.message = error
+        job.finished_at = datetime.utcnow()
+    else:
+        job.status = 'queued'
+    db.session.commit()
+    return job
+
+validation_executor = None
+validation_executor_lock = threading.Lock()
+
+def submit_validation_job(job_id):
+    global validation_executor
+    with validation_executor_lock:
+        if validation_executor is None:
+            validation_executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('VALIDATION_WORKERS', 2), thread_name_prefix='validation')
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            precheck_validation_job(job_id)
+
+    validation_executor.submit(run)
+
+def start_validation(user_id, action, data, monitored_area_id=None, success_status=200):
+    job = ValidationJob(id=str(uuid.uuid4()), user_id=user_id, action=action,
+                        monitored_area_id=monitored_area_id, payload=json.dumps(data))
+    db.session.add(job)
+    db.session.commit()
+
+    # Senza URL da verificare non serve la rete: la risposta è immediata
+    if not data.get('url'):
+        job = run_validation_job(job.id)
+        if job.status == 'succeeded':
+            return jsonify({'message': job.message, 'job': job.to_dict()}), success_status
+        return jsonify({'message': job.message, 'job': job.to_dict()}), 400
+
+    if is_cached(data['url']):
+        # DNS e HTTP già noti: un errore si restituisce subito, altrimenti il job va in coda
+        job = precheck_validation_job(job.id)
+        if job.status == 'failed':
+            return jsonify({'message': job.message, 'job': job.to_dict()}), 400
+    else:
+        submit_validation_job(job.id)
+    status_url = url_for('views.get_validation', job_id=job.id)
+    return jsonify({'message': 'Validation started', 'job': job.to_dict(), 'status_url': status_url}), \
+        202, {'Location': status_url}
 
-    return '', 200
 @views.route('/websites', methods=['POST'])
 @jwt_required()
 def add_website():
     current_user_id = getIdJWT()
     data = request.get_json()
-    url = data['url']
-    name = data.get('name')
-    area_selector = data.get('selector')
-    time_interval = data.get('time_interval', 60)
+    if not data.get('url') or not validate_url(normalize_url(data['url'])):
+        return jsonify({'message': 'Invalid URL'}), 400
+    if data.get('compare_mode', 'visual') not in COMPARE_MODES:
+        return jsonify({'message': 'Invalid compare mode'}), 400
+    settings_error = (check_interval_settings(data) or check_retention_settings(data)
+                      or check_readiness_settings(data))
+    if settings_error:
+        return jsonify({'message': settings_error}), 400
 
     try:
-        error, status = check_new_website(current_user_id, name, url)
-        if error != '':
-            return error, status
-
-        existing_website = Website.query.filter_by(url=url).first()
-        if not existing_website:
-            website = Website(url=url)
-            db.session.add(website)
-            db.session.commit()
-        else:
-            website = existing_website
-
-        # Crea l'area monitorata
-        new_monitored_area = MonitoredArea(
-            user_id=current_user_id,
-            website_id=website.id,
-            name=name,
-            area_selector=area_selector,
-            time_interval=time_interval
-        )
-        db.session.add(new_monitored_area)
-        db.session.commit()
-
-        return jsonify({'message': 'Website and monitored area added'}), 201
+        return start_validation(current_user_id, 'create', data, success_status=201)
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({'message': 'Database error', 'error': str(e)}), 500
-    except ValueError as e:
-        db.session.rollback()
-        return jsonify({'message': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'An error occurred', 'error': str(e)}), 500
@@ -169,8 +317,13 @@ def update_website(monitoredarea_id):
     data = request.get_json()
     name = data.get('name', '')
     url = data.get('url', '')
-    area_selector = data.get('selector', '')
-    time_interval = data.get('time_interval', 60)
+    compare_mode = data.get('compare_mode')
+    if compare_mode is not None and compare_mode not in COMPARE_MODES:
+        return jsonify({'message': 'Invalid compare mode'}), 400
+    settings_error = (check_interval_settings(data) or check_retention_settings(data)
+                      or check_readiness_settings(data))
+    if settings_error:
+        return jsonify({'message': settings_error}), 400
 
     try:
         monitored_area = MonitoredArea.query.filter_by(id=monitoredarea_id, user_id=current_user_id).first()
@@ -182,29 +335,56 @@ def update_website(monitoredarea_id):
         if monitored_area.name == name:
             name = ''
 
-        error, status = check_new_website(current_user_id, name, url)
-        if error != '':
-            return error, status
-
-        if name != '':
-            monitored_area.name = name
-        if url != '':
-            monitored_area.website.url = url
-
-        db.session.commit()
-
-        return jsonify({'message': 'Monitored area updated successfully'}), 200
+        payload = {'name': name, 'url': url, 'compare_mode': compare_mode}
+        for key in ('precheck', 'readiness_timeout', 'adaptive', 'min_interval', 'max_interval',
+                    *RETENTION_MINIMUMS):
+            if key in data:
+                payload[key] = data[key]
+        return start_validation(current_user_id, 'update', payload, monitored_area_id=monitored_area.id)
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({'message': 'Database error', 'error': str(e)}), 500
-    except ValueError as e:
-        db.session.rollback()
-        return jsonify({'message': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'message': 'An error occurred', 'error': str(e)}), 500
 
 
+@views.route('/retention', methods=['GET'])
+@jwt_required()
+def get_retention():
+    user = db.session.get(User, getIdJWT())
+    return jsonify({key: getattr(user, key) for key in RETENTION_MINIMUMS}), 200
+
+
+@views.route('/retention', methods=['PUT'])
+@jwt_required()
+def update_retention():
+    data = request.get_json()
+    error = check_retention_settings(data)
+    if error:
+        return jsonify({'message': error}), 400
+
+    user = db.session.get(User, getIdJWT())
+    for key in RETENTION_MINIMUMS:
+        if key in data:
+            setattr(user, key, data[key])
+    try:
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({'message': 'Database error', 'error': str(e)}), 500
+    return jsonify({key: getattr(user, key) for key in RETENTION_MINIMUMS}), 200
+
+
+@views.route('/validations/<job_id>', methods=['GET'])
+@jwt_required()
+def get_validation(job_id):
+    job = ValidationJob.query.filter_by(id=job_id, user_id=getIdJWT()).first()
+    if not job:
+        return jsonify({'message': 'Validation not found'}), 404
+    return jsonify(job.to_dict()), 200
+
+
 @views.route('/websites/<int:monitoredarea_id>', methods=['DELETE'])
 @jwt_required()
 def delete_website(monitoredarea_id):
@@ -230,9 +410,23 @@ def delete_website(monitoredarea_id):
 @jwt_required()
 def get_websites():
     current_user_id = getIdJWT()
-    monitored_areas = db.session.query(MonitoredArea).join(Website, MonitoredArea.website_id == Website.id).filter(
+    monitored_areas = db.session.query(MonitoredArea.id, MonitoredArea.name, MonitoredArea.time_interval,
+                                       MonitoredArea.adaptive_interval, MonitoredArea.min_interval,
+                                       MonitoredArea.max_interval, MonitoredArea.effective_interval,
+                                       MonitoredArea.compare_mode, Website.url).join(Website, MonitoredArea.website_id == Website.id).filter(
         MonitoredArea.user_id == current_user_id).all()
 
+    # Le ultime due modifiche di ogni area in una sola query, senza le colonne binarie
+    ranked = db.session.query(
+        Change.id, Change.monitored_area_id, Change.change_detected_at, Change.change_snapshot,
+        Change.change_summary, Change.changed_regions, Change.reviewed, Change.screenshot_key,
+        func.row_number().over(partition_by=Change.monitored_area_id,
+                               order_by=(Change.change_detected_at.desc(), Change.id.desc())).label('rank')
+    ).join(MonitoredArea).filter(MonitoredArea.user_id == current_user_id).subquery()
+    latest_changes = {}
+    for change in db.session.query(ranked).filter(ranked.c.rank <= 2).all():
+        latest_changes.setdefault(change.monitored_area_id, {})[change.rank] = change
+
     def change_to_dict(change):
         if change is None:
             return None
@@ -242,25 +436,127 @@ def get_websites():
             'change_detected_at': change.change_detected_at.isoformat(),
             'change_snapshot': change.change_snapshot,
             'change_summary': change.change_summary,
-            'screenshot': base64.b64encode(change.screenshot).decode('utf-8') if change.screenshot else None,
+            'screenshot_key': change.screenshot_key,
+            'screenshot_url': url_for('views.get_change_screenshot', change_id=change.id),
+            'thumbnail_urls': {width: url_for('views.get_change_thumbnail', change_id=change.id, width=width)
+                               for width in thumbnail_widths()},
+            'changed_regions': json.loads(change.changed_regions) if change.changed_regions else [],
             'reviewed': change.reviewed
         }
 
+    def diff_url(changes):
+        last, previous = changes.get(1), changes.get(2)
+        if last is None or previous is None or not last.screenshot_key or not previous.screenshot_key:
+            return None
+        return url_for('views.get_change_diff', change_id=last.id, base_id=previous.id)
+
     websites = [
         {
             'id': ma.id,
-            'url': ma.website.url,
+            'url': ma.url,
             'name': ma.name,
             'time_interval': ma.time_interval,
-            'last_change': change_to_dict(db.session.query(Change).filter_by(monitored_area_id=ma.id).order_by(
-                Change.change_detected_at.desc()).first()),
-            'previous_change': change_to_dict(db.session.query(Change).filter_by(monitored_area_id=ma.id).order_by(
-                Change.change_detected_at.desc()).offset(1).first())
+            'adaptive_interval': ma.adaptive_interval,
+            'min_interval': ma.min_interval,
+            'max_interval': ma.max_interval,
+            'effective_interval': ma.effective_interval,
+            'compare_mode': ma.compare_mode,
+            'last_change': change_to_dict(latest_changes.get(ma.id, {}).get(1)),
+            'diff_url': diff_url(latest_changes.get(ma.id, {})),
+            'previous_change': change_to_dict(latest_changes.get(ma.id, {}).get(2))
         }
         for ma in monitored_areas
     ]
     return jsonify(websites), 200
 
+def find_user_change(change_id):
+    return Change.query.filter_by(id=change_id).join(MonitoredArea).filter(
+        MonitoredArea.user_id == getIdJWT()).first()
+
+def send_blob(data, etag, mimetype):
+    # Le immagini sono indirizzate per contenuto: stesso ETag, stessi byte, per sempre
+    response = send_file(BytesIO(data), mimetype=mimetype, etag=etag, conditional=True)
+    response.cache_control.no_cache = None
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config.get('IMAGE_CACHE_MAX_AGE', 31536000)
+    response.cache_control.immutable = True
+    return response
+
+@views.route('/changes/<int:change_id>/screenshot', methods=['GET'])
+@jwt_required()
+def get_change_screenshot(change_id):
+    change = find_user_change(change_id)
+    if not change:
+        return jsonify({'message': 'Change not found'}), 404
+
+    data = load_screenshot(change)
+    if data is None:
+        return jsonify({'message': 'Screenshot no longer available'}), 404
+    return send_blob(data, change.screenshot_key or change.content_hash or BlobStore.key_for(data), 'image/png')
+
+@views.route('/changes/<int:change_id>/thumbnail/<int:width>', methods=['GET'])
+@jwt_required()
+def get_change_thumbnail(change_id, width):
+    if width not in thumbnail_widths():
+        return jsonify({'message': 'Unsupported thumbnail size'}), 404
+    change = find_user_change(change_id)
+    if not change:
+        return jsonify({'message': 'Change not found'}), 404
+
+    store = BlobStore.getInstance()
+    if not change.screenshot_key:
+        # Le righe non ancora migrate non hanno miniature: si usa l'immagine intera
+        data = load_screenshot(change)
+        if data is None:
+            return jsonify({'message': 'Screenshot no longer available'}), 404
+        return send_blob(data, change.content_hash or BlobStore.key_for(data), 'image/png')
+
+    key = thumbnail_key(change.screenshot_key, width)
+    if not store.exists(key):
+        # Modifiche salvate prima delle miniature: vengono generate una volta sola
+        from .thumbnails import store_thumbnails, decode_color
+        store_thumbnails(change.screenshot_key, decode_color(load_screenshot(change)))
+    return send_blob(store.get(key), key, 'image/jpeg')
+
+@views.route('/differences/<int:difference_id>/image', methods=['GET'])
+@jwt_required()
+def get_difference_image(difference_id):
+    difference = Difference.query.filter_by(id=difference_id).join(
+        Change, Difference.change_id1 == Change.id).join(MonitoredArea).filter(
+        MonitoredArea.user_id == getIdJWT()).first()
+    if not difference:
+        return jsonify({'message': 'Difference not found'}), 404
+
+    data = load_diff_image(difference)
+    return send_blob(data, difference.diff_image_key or BlobStore.key_for(data), 'image/png')
+
+@views.route('/changes/<int:change_id>/diff', methods=['GET'])
+@views.route('/changes/<int:change_id>/diff/<int:base_id>', methods=['GET'])
+@jwt_required()
+def get_change_diff(change_id, base_id=None):
+    change = find_user_change(change_id)
+    if not change:
+        return jsonify({'message': 'Change not found'}), 404
+    if base_id is None:
+        # Senza base esplicita: la modifica precedente con uno screenshot
+        base = Change.query.filter(
+            Change.monitored_area_id == change.monitored_area_id, Change.screenshot_key.isnot(None),
+            or_(Change.change_detected_at < change.change_detected_at,
+                and_(Change.change_detected_at == change.change_detected_at, Change.id < change.id))).order_by(
+            Change.change_detected_at.desc(), Change.id.desc()).first()
+    else:
+        base = find_user_change(base_id)
+    if not base or base.monitored_area_id != change.monitored_area_id:
+        return jsonify({'message': 'Change to compare with not found'}), 404
+
+    from .diffs import get_difference
+    difference = get_difference(base, change)
+    if difference is None:
+        return jsonify({'message': 'Screenshot no longer available'}), 404
+    etag, data = difference
+    return send_blob(data, etag, 'image/png')
+
 @views.route('/changes/<int:change_id>/read', methods=['POST'])
 @jwt_required()
 def mark_change_as_read(change_id):
@@ -273,24 +569,73 @@ def mark_change_as_read(change_id):
     db.session.commit()
     return jsonify({'message': 'Change marked as read'}), 200
 
+def encode_cursor(change_detected_at, change_id):
+    return base64.urlsafe_b64encode(json.dumps([change_detected_at.isoformat(), change_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        change_detected_at, change_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(change_detected_at), int(change_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
 @views.route('/changes', methods=['GET'])
 @jwt_required()
 def get_changes():
     current_user_id = getIdJWT()
-    monitored_areas = MonitoredArea.query.filter_by(user_id=current_user_id).all()
-    area_ids = [ma.id for ma in monitored_areas]
-    changes = Change.query.filter(Change.monitored_area_id.in_(area_ids)).all()
-    changes_list = [
-        {
-            'id': change.id,
-            'monitored_area_id': change.monitored_area_id,
-            'change_detected_at': change.change_detected_at,
-            'change_summary': change.change_summary,
-            'screenshot': change.screenshot
-        }
-        for change in changes
-    ]
-    return jsonify(changes_list), 200
+    args = request.args
+    try:
+        limit = min(int(args.get('limit', 50)), 200)
+        if limit <= 0:
+            raise ValueError('Invalid limit')
+
+        query = db.session.query(Change.id, Change.monitored_area_id, Change.change_detected_at,
+                                 Change.change_summary, Change.changed_regions, Change.reviewed,
+                                 Change.screenshot_key).join(MonitoredArea).filter(
+            MonitoredArea.user_id == current_user_id)
+        if 'area_id' in args:
+            query = query.filter(Change.monitored_area_id == int(args['area_id']))
+        if 'reviewed' in args:
+            query = query.filter(Change.reviewed == (args['reviewed'].lower() == 'true'))
+        if 'since' in args:
+            query = query.filter(Change.change_detected_at >= datetime.fromisoformat(args['since']))
+        if 'until' in args:
+            query = query.filter(Change.change_detected_at < datetime.fromisoformat(args['until']))
+        if 'cursor' in args:
+            cursor_detected_at, cursor_id = decode_cursor(args['cursor'])
+            query = query.filter(or_(Change.change_detected_at < cursor_detected_at,
+                                     and_(Change.change_detected_at == cursor_detected_at,
+                                          Change.id < cursor_id)))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    # Una riga in più dice se esiste una pagina successiva
+    rows = query.order_by(Change.change_detected_at.desc(), Change.id.desc()).limit(limit + 1).yield_per(100)
+
+    def generate():
+        yield '{"changes": ['
+        last = None
+        for index, change in enumerate(rows):
+            if index == limit:
+                break
+            last = change
+            yield (', ' if index else '') + json.dumps({
+                'id': change.id,
+                'monitored_area_id': change.monitored_area_id,
+                'change_detected_at': change.change_detected_at.isoformat(),
+                'change_summary': change.change_summary,
+                'changed_regions': json.loads(change.changed_regions) if change.changed_regions else [],
+                'reviewed': change.reviewed,
+                'screenshot_key': change.screenshot_key,
+                'screenshot_url': url_for('views.get_change_screenshot', change_id=change.id)
+                if change.screenshot_key else None
+            })
+        else:
+            last = None
+        next_cursor = encode_cursor(last.change_detected_at, last.id) if last is not None else None
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json'), 200
 
 @views.route('/verify', methods=['POST'])
 @jwt_required()
@@ -303,4 +648,11 @@ def verify():
 
 @views.route('/health', methods=['GET'])
 def health():
-    return jsonify({"msg": "OK"}), 200
\ No newline at end of file
+    return jsonify({"msg": "OK"}), 200
+
+
+# Metriche del solo processo API: quelle dei controlli (stage_seconds, check_seconds,
+# area_checks, ...) vivono nei worker e si leggono su WORKER_METRICS_PORT
+@views.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(Metrics.getInstance().render(), mimetype='text/plain; version=0.0.4')
\ No newline at end of file
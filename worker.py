@@ -0,0 +1,96 @@
+import argparse
+import threading
+import time
+import traceback
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from . import create_app
+from .models import db
+from .metrics import Metrics
+from .leases import claim_validation_job, fail_stale_validation_jobs
+from .logger import Logger
+from .monitor import run_worker, new_worker_id
+from .compaction import start_compaction
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = Metrics.getInstance().render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Le metriche del monitor vivono nel processo worker: se configurata, una porta
+# dedicata le espone a Prometheus come la route /metrics dell'API
+def start_metrics_server(port):
+    server = ThreadingHTTPServer(('0.0.0.0', port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+# Verifiche con il browser dei siti aggiunti o modificati: l'API fa solo i controlli
+# DNS/HTTP e mette in coda il ValidationJob, il primo worker libero lo esegue
+def run_validation_jobs(app):
+    from .views import run_validation_job
+    config = app.config
+    while True:
+        job_id, requeued = None, False
+        with app.app_context():
+            try:
+                now = datetime.utcnow()  # come ValidationJob.created_at
+                fail_stale_validation_jobs(now, config.get('VALIDATION_JOB_TIMEOUT', 300))
+                job_id = claim_validation_job(now)
+                if job_id is not None:
+                    requeued = run_validation_job(job_id).status == 'queued'
+            except Exception as e:
+                db.session.rollback()
+                Logger.getInstance().log(f"Validation worker error: {e}", level='error', job_id=job_id,
+                                         traceback=traceback.format_exc())
+            finally:
+                db.session.remove()
+        if job_id is None or requeued:
+            # Rimesso in coda per il pool occupato: si riprova dopo una pausa
+            time.sleep(config.get('VALIDATION_POLL_INTERVAL', 2))
+
+
+def start_validation_worker(app):
+    thread = threading.Thread(target=run_validation_jobs, args=(app,), name='validation')
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+# Processo worker del monitor: si possono avviarne quanti se ne vuole, anche su
+# macchine diverse, purché usino lo stesso database; le aree vengono divise tra
+# loro tramite i lease su MonitoredArea.
+def main():
+    parser = argparse.ArgumentParser(description='Run a monitor worker.')
+    parser.add_argument('--worker-id', default=None, help='lease owner name (default: host-pid-random)')
+    parser.add_argument('--metrics-port', type=int, default=None, help='port for /metrics (0: disabled)')
+    parser.add_argument('--no-compaction', action='store_true', help='do not run screenshot compaction here')
+    args = parser.parse_args()
+
+    app = create_app(start_monitor=False)
+    metrics_port = args.metrics_port if args.metrics_port is not None else app.config.get('WORKER_METRICS_PORT')
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    worker_id = args.worker_id or new_worker_id()
+    start_validation_worker(app)
+    if app.config.get('COMPACTION_ENABLED', True) and not args.no_compaction:
+        start_compaction(app, f'{worker_id}-compaction')
+    run_worker(app, worker_id)
+
+
+if __name__ == '__main__':
+    main()